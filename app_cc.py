@@ -1,18 +1,23 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import math
-import numpy as np
 from streamlit_option_menu import option_menu
 
-from services.database_utils import get_results_WC
-from services.database_utils import get_seasons_LC, get_selected_data_LC, get_selection_options_LC
+from services.database_utils import get_results_WC, get_aggregates_WC, get_standings_WC, get_position_matrix_WC
+from services.database_utils import select_athlete_results_WC, table_key_WC
+from services.database_utils import get_seasons_LC, get_selected_data_LC, get_selection_options_LC, get_season_data_LC, get_points_list_LC
+from services.prefetch import prefetch, current_season
+from services.swr import data_as_of_caption, peek
+from services.warmup import start_warmup, record_view, warmup_summary
+from services.tracing import start_trace, stage, finish_trace, render_trace_panel
+from services.results_index import select_results
+from services.results_store import compaction_summary
+from services.results_table import render_results_table
 
-from services.data_functions import count_results, get_card_metrics_WC, transform_results, highlight_positions, highlight_status
-from services.data_functions import rank_points_mapping, color_mapping_disciplines, symbol_map
-from services.data_functions import get_top2_results, transform_results, get_numbers_LC
-from services.data_functions import highlight_FIS_Points
+from services.data_functions import build_display_table, get_display_table, DISPLAY_TABLE_CACHE
+from services.data_functions import lookup_standing, head_to_head, head_to_head_table
+from services.data_functions import get_top_results, top_result, get_numbers_LC
+from services.data_functions import style_positions, style_status, style_FIS_Points
+from services.data_functions import get_athlete_aggregates_WC, filter_aggregates_WC, get_card_metrics_from_aggregates_WC
+from services.charts import get_figure, discipline_bar_spec, podium_donut_spec, results_line_spec, FIGURE_CACHE
 
 
 
@@ -37,9 +42,15 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Pages of the menu
+PAGES = ["Cross Country"]
+
+# Warm the loader caches of these pages in the background (first rerun of the process only), then on a schedule
+start_warmup(PAGES)
+
 
 selected = option_menu(
-            None, [ "Cross Country"],
+            None, PAGES,
             icons=["trophy-fill", "trophy"],
             orientation= "horizontal",
             styles={
@@ -63,7 +74,15 @@ if selected == "Cross Country":
 
     st.title('Results Cross Country')
 
-    df, athletes_unique, seasons_unique, description_unique = get_results_WC()
+    start_trace("Cross Country")
+    stage("load data")
+
+    df, athletes_unique, seasons_unique, description_unique, results_index, data_version = get_results_WC()
+    st.caption(data_as_of_caption(get_results_WC))
+
+    # Build the overview aggregates and the standings in the background while the widgets render
+    prefetch(get_aggregates_WC)
+    prefetch(get_standings_WC)
 
     compare_on = st.toggle("Compare Athletes")
 
@@ -99,32 +118,22 @@ if selected == "Cross Country":
 
 
     ### APPLY FILTERS FROM SELECTION ###
+    stage("filter")
 
     if not compare_on:
-        df = df[df["Competitorname"] == athlete_select]
-        nation = df['Competitor_Nationcode'].unique().tolist()
+        # Counted once per selection, not on every rerun of the same athlete
+        if st.session_state.get("viewed_athlete_WC") != athlete_select:
+            record_view("WC", athlete_select)
+            st.session_state.viewed_athlete_WC = athlete_select
+        athletes = [athlete_select]
+        nation = select_results(df, results_index, athletes)['Competitor_Nationcode'].unique().tolist()
         nation = nation[0]
     else:
-        df = df[df["Competitorname"].isin(athlete_select)]
-
-
-    df_cards = df.copy()
-    df_cards = df_cards[df_cards["Description"].isin(description_select)]
+        athletes = athlete_select
 
-    #Filter by season
-    df = df[df["Seasoncode"] == season_select]
 
-    #Add WC_Points to the dataframe
-    df['WC_Points'] = df['Position'].map(rank_points_mapping).fillna(0).astype(int)
-
-    #Create a copy for the barchart without discipline filter
-    df_barchart = df.copy()
-
-    #Filter by discipline
-    df = df[df["Description"].isin(description_select)]
-
-    #Order by Racedate
-    df = df.sort_values(by='Racedate')
+    #Filter by season and discipline, add WC_Points and order by Racedate
+    df = select_athlete_results_WC(df, results_index, athletes, season_select, description_select)
 
     #Create a copy for the lineplot without DNS and DNF
     df_lineplot = df[df["Position"] != 0]
@@ -132,85 +141,51 @@ if selected == "Cross Country":
 
 
     ### PAGE CONTENT ###
+    stage("overview")
+
     if not compare_on:
 
         st.divider()
         st.subheader(f'Overview for {athlete_select} ({nation})')
 
+        # Look up the precomputed metrics of the athlete
+        df_aggregates = get_athlete_aggregates_WC(get_aggregates_WC(), athlete_select)
+        season_aggregates = filter_aggregates_WC(df_aggregates, season_select, description_select).sum()
+
         col2_1, col2_2, col2_3 = st.columns([3,3,1])
 
         with col2_1:
-            chart_data = df_barchart.groupby("Description", as_index=False)["WC_Points"].sum()
-
-            # Rename columns
-            chart_data.columns = ["Discipline", "WC Points"]
-
-            # Create an entry with discipline "Total Points" and sum of all WC_Points
-            total_points = chart_data["WC Points"].sum()
-            chart_data.loc[len(chart_data)] = ["Total Points", total_points]
-
-            # Create colormapping for discipline bars
-            chart_data["Color"] = chart_data["Discipline"].map(color_mapping_disciplines).fillna("gray")
-
-            # Display bar chart with custom colors and text inside bars
-            bars = px.bar(
-                chart_data, 
-                x="Discipline", 
-                y="WC Points", 
-                text_auto=True  # Display values inside bars
-            )
-
-            # Apply custom colors using `marker_color`
-            bars.update_traces(marker=dict(color=chart_data["Color"], opacity=0.6), textposition='outside')
-
-            bars.update_layout(
-                height=400,
-                margin=dict(l=20, r=20, t=50, b=20),
-                showlegend=False
-            )
+            def build_bars():
+                # WC points per discipline of the season (without discipline filter) plus the total
+                chart_data = filter_aggregates_WC(df_aggregates, season_select)["WC_Points"].reset_index(level="Seasoncode", drop=True)
+                return discipline_bar_spec(list(chart_data.index) + ["Total Points"], chart_data.tolist() + [chart_data.sum()], "WC Points", 400)
 
             # Plot the bar chart
+            bars = get_figure(("WC bars", data_version, athlete_select, season_select), build_bars)
             st.plotly_chart(bars, use_container_width=True)
 
         with col2_2:
             # Get result counts
-            counts, count_all = count_results(df)
-
-            labels = ['Wins','Seconds','Thirds']
-            values = counts
-            colors = ['gold', 'silver', 'chocolate']
+            counts = [int(season_aggregates["Wins"]), int(season_aggregates["Seconds"]), int(season_aggregates["Thirds"])]
+            count_all = int(season_aggregates["Races"])
 
             # Create donut pie chart
-            pie = go.Figure(data=[go.Pie(
-                                    labels=labels, 
-                                    values=values, 
-                                    hole=.5, 
-                                    marker=dict(colors=colors),
-                                    textinfo="label+value"
-                                )])
-
-            pie.update_layout(
-                height=400,
-                annotations=[dict(
-                        text= f'#{count_all} in Total', x=0.5 , y=0.5,
-                        font_size=20, showarrow=False, xanchor="center"
-                    )],
-                legend=dict(
-                        orientation="h",  #Puts legend in a row
-                        yanchor="bottom", y=-0.1,  #Moves legend above plot
-                        xanchor="center", x=0.5  #Centers legend
-                    ),
-                margin=dict(
-                    l=20, r=20, t=50, b=20
-                    )
-            )
+            pie = get_figure(("WC donut", *counts, count_all), lambda: podium_donut_spec(counts, count_all))
 
             #Plot the pie chart
             st.plotly_chart(pie, use_container_width=True)
 
         with col2_3:
+            #Rank in the overall standings of the season
+            standing = lookup_standing(get_standings_WC(), season_select, athlete_select)
+            if standing is not None:
+                rank, points, gap = standing
+                st.metric("WC Standings", f"#{rank} ({points} pts)", f"-{gap} pts to leader" if gap else "Leader", delta_color="off", border=True)
+            else:
+                st.metric("WC Standings", "No points", border=True)
+
             #Get card metrics
-            card_metrics, diff_card_metrics = get_card_metrics_WC(df, df_cards, season_select)
+            card_metrics, diff_card_metrics = get_card_metrics_from_aggregates_WC(df_aggregates, season_select, description_select)
 
             #Plot metrics
             st.metric("Finished in [1-3]", card_metrics[0], diff_card_metrics[0], border=True)
@@ -218,20 +193,21 @@ if selected == "Cross Country":
             st.metric("Finished in [11-30]", card_metrics[2], diff_card_metrics[2], border=True)
 
     st.divider()
+    stage("results table")
 
-    #Transform the results dataframe
-    df = transform_results(df, compare_on = compare_on)
+    #Transform the results dataframe (reused when only an unrelated widget changed)
+    table_key = table_key_WC(data_version, athletes, season_select, description_select, compare_on)
+    df = get_display_table(table_key, lambda: build_display_table(df, compare_on=compare_on))
 
-    #Apply custom styling to the dataframe highlighting positions and status
-    styled_df = (df.style
-                    .map(highlight_positions, subset=['Position'])
-                    .map(highlight_status, subset=['Status']))
+    #Custom styling highlighting positions and status (applied to the visible page only)
+    styles = [(style_positions, 'Position', {}), (style_status, 'Status', {})]
+    column_config = {'Racedate': st.column_config.DateColumn('Racedate'), 'FIS Points': st.column_config.NumberColumn('FIS Points', format='%.2f')}
 
     if not compare_on:
         st.subheader(f'Results for {athlete_select}')
 
         #Change column order
-        st.dataframe(styled_df, hide_index=True, use_container_width=True,
+        render_results_table(df, "results_WC", styles=styles, column_config=column_config,
                         column_order=[
                             'RaceID',
                             'Racedate',
@@ -251,7 +227,7 @@ if selected == "Cross Country":
 
         if len(athlete_select) != 0:
             #Change column order
-            st.dataframe(styled_df, hide_index=True, use_container_width=True,
+            render_results_table(df, "results_WC", styles=styles, column_config=column_config,
                         column_order=[
                             'RaceID',
                             'Racedate',
@@ -266,75 +242,26 @@ if selected == "Cross Country":
                             'Racetime',
                             'WC Points',
                             'FIS Points'])
+
+            if len(athlete_select) > 1:
+                st.subheader('Head-to-head')
+
+                #Wins-losses of the row athlete against the column athlete in the races both finished
+                h2h = head_to_head(get_position_matrix_WC(season_select), athlete_select, description_select)
+                st.dataframe(head_to_head_table(h2h), use_container_width=True)
+                st.caption("Wins-losses of the row athlete against the column athlete (average position gap)")
             
         else:
             st.warning("Please select at least one athlete to compare")
 
 
     # Create lineplot
-    if len(athlete_select) != 0:
-        # Create the plot
-        if not compare_on:
-            fig = px.line(df_lineplot, x='Racedate', y='Position', markers=True, text='Position')
-        else:
-            fig = px.line(df_lineplot, x='Racedate', y='Position', markers=True, text='Position', color='Competitorname')
-
-        # Customize datapoints: use a constant symbol for every marker
-        fig.update_traces(marker=dict(size=13, symbol="circle", color='black'))
+    stage("line plot")
 
-        # Customize text labels
-        fig.update_traces(textposition="bottom center", textfont=dict(size=15, color='black'))
-
-        # Add Top 10 line
-        fig.add_hline(y=10, line_dash="dash", line_color="black")
-
-        # Ensure y-axis always covers the correct range
-        max_position = df_lineplot['Position'].max() if (not math.isnan(df_lineplot['Position'].max())) else 0
-        max_range = math.ceil(max_position / 10.0) * 10
-
-        fig.update_yaxes(
-            range=[max_range+11, 0], 
-            tick0=5, dtick=5,  # Grid lines every 5 ranks  
-            showgrid=True, gridcolor="lightgray", gridwidth=0.5  # Custom grid styling
-        )
-
-        # Format x-axis dates to DD-MM-YYYY
-        fig.update_layout(
-            xaxis=dict(tickformat="%d-%m-%Y")
-        )
-
-        # Customize hover appearance 
-        fig.update_traces(
-            customdata=df_lineplot[['Disciplinecode', 'Place']],
-            hovertemplate="<b>Date:</b> %{x}<br>"  # Display Race Date
-                        "<b>Position:</b> %{y}<br>"  # Display Position
-                        "<b>Discipline:</b> %{customdata[0]}<br>"  # Show Discipline Code
-                        "<b>Place:</b> %{customdata[1]}"  # Show Place
-        )
-
-        # Add customized legend with discipline symbols
-        legend_traces = []
-
-        for discipline, symbol in symbol_map.items():
-            legend_traces.append(go.Scatter(
-                x=[None],  # No actual x values (dummy trace)
-                y=[None],  # No actual y values
-                mode='markers',
-                marker=dict(size=13, symbol=symbol, color='black'),
-                name=discipline  # Legend label
-            ))
-
-        # Add the custom legend traces to the figure
-        fig.add_traces(legend_traces)
-
-        # Position the legend above the plot in a single line
-        fig.update_layout(
-            legend=dict(
-                orientation="h",  # Horizontal legend
-                yanchor="bottom", y=1.1,  # Place it above the plot
-                xanchor="center", x=0.5  # Center-align the legend
-            )
-        )
+    if len(athlete_select) != 0:
+        # Positions over time with the top 10 line, rebuilt only when the selection changes
+        line_key = ("WC line", data_version, tuple(athletes), season_select, tuple(description_select), compare_on)
+        fig = get_figure(line_key, lambda: results_line_spec(df_lineplot, 'Position', 'Position', 'Position', compare_on, top_line=10))
 
         # Plot the line chart
         st.plotly_chart(fig, use_container_width=True)
@@ -375,11 +302,21 @@ elif selected == "Lower Cup":
 
     st.title('Results Alpine Skiing Lower Cup')
 
+    start_trace("Lower Cup")
+    stage("selection")
+
     compare_on = st.toggle("Compare Athletes")
     swiss_only_on = st.toggle("Show only swiss races")
 
+    # Start the independent loads together: seasons and the (likely) selected season partition
+    # (the selectbox defaults to the latest known season, guessed from the date only on a cold start)
+    seasons_future = prefetch(get_seasons_LC)
+    seasons_cached_LC = peek(get_seasons_LC)
+    default_season_LC = seasons_cached_LC[0] if seasons_cached_LC else current_season()
+    prefetch(get_season_data_LC, st.session_state.get("season_select_LC", default_season_LC))
+
     # Load data unique seasons and athletes
-    seasons_unique_LC = get_seasons_LC()
+    seasons_unique_LC = seasons_future.result()
 
     col1, col2, col3, col4 = st.columns([1,1,1,1])
 
@@ -387,9 +324,15 @@ elif selected == "Lower Cup":
         season_select_LC = st.selectbox(
             ':blue[Season]',
             seasons_unique_LC,
+            key="season_select_LC"
             )
         # Get the selection options based on the selected season
         df = get_selection_options_LC(season_select_LC)
+        st.caption(data_as_of_caption(get_season_data_LC, season_select_LC))
+
+        # Speculatively load the previous season, the next one coaches usually look at
+        if season_select_LC - 1 in seasons_unique_LC:
+            prefetch(get_season_data_LC, season_select_LC - 1)
 
     with col2:
         if not compare_on:
@@ -444,6 +387,8 @@ elif selected == "Lower Cup":
 
 
     ### LOAD & FILTER DATA ###
+    stage("load data")
+
     if not compare_on:
         st.session_state.results_LC, nation, categories_unique, disciplines_unique = get_selected_data_LC(season_select_LC, athlete_select_LC)
     else:
@@ -452,9 +397,13 @@ elif selected == "Lower Cup":
     if swiss_only_on:
         st.session_state.results_LC = st.session_state.results_LC[st.session_state.results_LC["Nationcode"] == "SUI"]
 
+    # Data version and selection of results_LC, keys the cached tables and charts
+    athletes_key_LC = tuple(athlete_select_LC) if compare_on else (athlete_select_LC,)
+    chart_key_LC = (get_season_data_LC(season_select_LC)[2], season_select_LC, athletes_key_LC, swiss_only_on, compare_on)
 
 
     ### PAGE CONTENT ###
+    stage("overview")
 
     if not st.session_state.results_LC.empty and st.session_state.results_LC is not None:
 
@@ -482,39 +431,14 @@ elif selected == "Lower Cup":
             col3_1, col3_2 = st.columns([1,1])
 
             with col3_1:
-                df_prep = st.session_state.results_LC.copy()
-
-                def avg_best_two(group):
-                    # Select the smallest two values and compute mean
-                    return group.nsmallest(2).mean()  
-
-                # Group by 'Disciplines' and apply the function
-                chart_data = df_prep.groupby("Description")["Racepoints"].apply(avg_best_two).reset_index()
-
-                # Rename columns
-                chart_data.columns = ["Discipline", "AVG Points"]
-
-                # Create colormapping for discipline bars
-                chart_data["Color"] = chart_data["Discipline"].map(color_mapping_disciplines).fillna("gray")
-
-                # Display bar chart with custom colors and text inside bars
-                bars = px.bar(
-                    chart_data, 
-                    x="Discipline", 
-                    y="AVG Points", 
-                    text_auto=True  # Display values inside bars
-                )
-
-                # Apply custom colors using `marker_color`
-                bars.update_traces(marker=dict(color=chart_data["Color"], opacity=0.6), textposition='outside')
-
-                bars.update_layout(
-                    height=500,
-                    margin=dict(l=20, r=20, t=50, b=20),
-                    showlegend=False 
-                )
+                def build_bars_LC():
+                    # Average of the best two FIS points per discipline of the season from the precomputed points list
+                    points_list = get_points_list_LC(season_select_LC, swiss_only_on, chart_key_LC[0])
+                    chart_data = points_list[points_list.index.get_level_values("Competitorname") == athlete_select_LC]["AVG Points"]
+                    return discipline_bar_spec(chart_data.index.get_level_values("Description"), chart_data.tolist(), "AVG Points", 500)
 
                 # Plot the bar chart
+                bars = get_figure(("LC bars", *chart_key_LC), build_bars_LC)
                 st.plotly_chart(bars, use_container_width=True)
 
             with col3_2:
@@ -546,97 +470,40 @@ elif selected == "Lower Cup":
 
                 col5_1, col5_2 = st.columns([1,1])
 
-                with col5_1:
-                    if "Slalom" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Slalom", 1)
-                        st.metric(
-                            f"Best Slalom: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Giant Slalom" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Giant Slalom", 1)
-                        st.metric(
-                            f"Best Giant Slalom: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Super G" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Super G", 1)
-                        st.metric(
-                            f"Best Super G: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Downhill" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Downhill", 1)
-                        st.metric(
-                            f"Best Downhill: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Alpine Combined" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Alpine Combined", 1)
-                        st.metric(
-                            f"Best Alpine Combined: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
+                # Best and second best result of every discipline from one pass over the results
+                top_results = get_top_results(st.session_state.results_LC, 2)
 
-                with col5_2:
-                    if "Slalom" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Slalom", 2)
-                        st.metric(
-                            f"2nd. Best Slalom: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Giant Slalom" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Giant Slalom", 2)
-                        st.metric(
-                            f"2nd. Best Giant Slalom: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Super G" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Super G", 2)
-                        st.metric(
-                            f"2nd. Best Super G: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Downhill" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Downhill", 2)
-                        st.metric(
-                            f"2nd. Best Downhill: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
-                    if "Alpine Combined" in disciplines_select_LC:
-                        pts, loc, dat = get_top2_results(st.session_state.results_LC, "Alpine Combined", 2)
-                        st.metric(
-                            f"2nd. Alpine Combined: ({loc})",
-                            f"{pts} pts. ({dat})" if pts >= 0 else "No points",
-                            border=True
-                        )
+                for col, number, label in ((col5_1, 1, "Best"), (col5_2, 2, "2nd. Best")):
+                    with col:
+                        for discipline in ["Slalom", "Giant Slalom", "Super G", "Downhill", "Alpine Combined"]:
+                            if discipline in disciplines_select_LC:
+                                pts, loc, dat = top_result(top_results, discipline, number)
+                                st.metric(
+                                    f"{label} {discipline}: ({loc})",
+                                    f"{pts} pts. ({dat})" if pts >= 0 else "No points",
+                                    border=True
+                                )
 
         # Filtering the table
-        df_table = st.session_state.results_LC.copy()
-        df_table = df_table[df_table["Description"].isin(disciplines_select_LC)]
-        df_table = df_table[df_table["Catcode"].isin(categories_select_LC)]
-        df_table = df_table.sort_values(by='Racedate')
+        stage("results table")
 
-        #Transform the results dataframe
-        df_table = transform_results(df_table, compare_on = compare_on, FIS = True)
+        def build_table_LC():
+            df_table = st.session_state.results_LC
+            df_table = df_table[df_table["Description"].isin(disciplines_select_LC) & df_table["Catcode"].isin(categories_select_LC)]
 
-        #Apply custom styling to the dataframe highlighting positions and status
-        min_fis = df_table["FIS Points"].replace(0, np.nan).min() 
+            #Transform the results dataframe (sorted by Racedate)
+            return build_display_table(df_table, compare_on=compare_on, FIS=True)
+
+        # Reuse the table when only an unrelated widget changed
+        table_key = ("LC", *chart_key_LC, tuple(disciplines_select_LC), tuple(categories_select_LC))
+        df_table = get_display_table(table_key, build_table_LC)
+
+        #Custom styling of FIS points and status, the gradient spans the whole table not just the visible page
+        min_fis = df_table["FIS Points"].replace(0, float("nan")).min() 
         max_fis = df_table["FIS Points"].max()
 
-        styled_df = (df_table.style
-                    .map(lambda x: highlight_FIS_Points(x, min_fis, max_fis), subset=['FIS Points'])
-                    .map(highlight_status, subset=['Status'])
-                    .format({"FIS Points": "{:.2f}"}))
+        styles = [(style_FIS_Points, 'FIS Points', {'min_val': min_fis, 'max_val': max_fis}), (style_status, 'Status', {})]
+        column_config = {'Racedate': st.column_config.DateColumn('Racedate'), 'FIS Points': st.column_config.NumberColumn('FIS Points', format='%.2f')}
 
         st.divider()
 
@@ -644,7 +511,7 @@ elif selected == "Lower Cup":
             st.subheader(f'Results for {athlete_select_LC}') 
 
             #Change column order
-            st.dataframe(styled_df, hide_index=True, use_container_width=True,
+            render_results_table(df_table, "results_LC", styles=styles, column_config=column_config,
                             column_order=[
                                 'RaceID',
                                 'Racedate',
@@ -664,7 +531,7 @@ elif selected == "Lower Cup":
 
             if len(athlete_select_LC) != 0:
                 #Change column order
-                st.dataframe(styled_df, hide_index=True, use_container_width=True,
+                render_results_table(df_table, "results_LC", styles=styles, column_config=column_config,
                             column_order=[
                                 'RaceID',
                                 'Racedate',
@@ -684,78 +551,22 @@ elif selected == "Lower Cup":
                 st.warning("Please select at least one athlete to compare")
 
         # Create lineplot
-        if len(athlete_select_LC) != 0:
-
-            df_lineplot = st.session_state.results_LC.copy()
-            df_lineplot = df_lineplot.sort_values(by='Racedate')
-            df_lineplot = df_lineplot.dropna(subset=['Racepoints'])
-
-            # Create a new column 'Symbol' by mapping 'Disciplinecode' to symbols
-            df_lineplot['Symbol'] = df_lineplot['Disciplinecode'].map(symbol_map)
-
-            # Create the plot
-            if not compare_on:
-                fig = px.line(df_lineplot, x='Racedate', y='Racepoints', markers=True, text='Racepoints')
-            else:
-                fig = px.line(df_lineplot, x='Racedate', y='Racepoints', markers=True, text='Racepoints', color='Competitorname')
-
-            # Customize datapoints
-            fig.update_traces(marker=dict(size=13, symbol=df_lineplot['Symbol'], color='black'))
+        stage("line plot")
 
-            # Customize text labels
-            fig.update_traces(textposition="bottom center", textfont=dict(size=15, color='black'))
-
-            # Ensure y-axis always covers the correct range
-            max_position = df_lineplot['Racepoints'].max() if (not math.isnan(df_lineplot['Racepoints'].max())) else 0
-            max_range = math.ceil(max_position / 10.0) * 10
-
-            fig.update_yaxes(
-                title_text="FIS Points",    # Rename y-axis to 'FIS Points'
-                range=[max_range+11, 0], 
-                tick0=5, dtick=5,  # Grid lines every 5 ranks  
-                showgrid=True, gridcolor="lightgray", gridwidth=0.5  # Custom grid styling
-            )
-
-            # Format x-axis dates to DD-MM-YYYY
-            fig.update_layout(
-                xaxis=dict(tickformat="%d-%m-%Y")
-            )
-
-            # Customize hover appearance 
-            fig.update_traces(
-                customdata=df_lineplot[['Disciplinecode', 'Place']],
-                hovertemplate="<b>Date:</b> %{x}<br>"  # Display Race Date
-                            "<b>FIS Points:</b> %{y}<br>"  # Display Position
-                            "<b>Discipline:</b> %{customdata[0]}<br>"  # Show Discipline Code
-                            "<b>Place:</b> %{customdata[1]}"  # Show Place
-            )
+        if len(athlete_select_LC) != 0:
+            def build_line_LC():
+                df_lineplot = st.session_state.results_LC.sort_values(by='Racedate').dropna(subset=['Racepoints'])
+                return results_line_spec(df_lineplot, 'Racepoints', 'FIS Points', 'FIS Points', compare_on, symbols=True)
 
-            # Add customized legend with discipline symbols
-            legend_traces = []
-
-            for discipline, symbol in symbol_map.items():
-                legend_traces.append(go.Scatter(
-                    x=[None],  # No actual x values (dummy trace)
-                    y=[None],  # No actual y values
-                    mode='markers',
-                    marker=dict(size=13, symbol=symbol, color='black'),
-                    name=discipline  # Legend label
-                ))
-
-            # Add the custom legend traces to the figure
-            fig.add_traces(legend_traces)
-
-            # Position the legend above the plot in a single line
-            fig.update_layout(
-                legend=dict(
-                    orientation="h",  # Horizontal legend
-                    yanchor="bottom", y=1.1,  # Place it above the plot
-                    xanchor="center", x=0.5  # Center-align the legend
-                )
-            )
+            # FIS points over time with the discipline symbols
+            fig = get_figure(("LC line", *chart_key_LC), build_line_LC)
 
             # Plot the line chart
             st.plotly_chart(fig, use_container_width=True)
 
     else:
         st.write("No data available for this selection.")
+
+
+# Debug waterfall of this rerun (only with CROSSCOUNTY_TRACE=1 and ?debug=1)
+render_trace_panel(finish_trace(), caches={"Display tables": DISPLAY_TABLE_CACHE, "Figures": FIGURE_CACHE}, notes=[warmup_summary(), compaction_summary()])
@@ -0,0 +1,121 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_fis_results
+from services.database_utils import prepare_results_WC
+from services.data_functions import build_display_table, build_aggregates_WC, get_top_results, get_numbers_LC
+from services.data_functions import style_positions, style_status, style_FIS_Points
+from services.data_functions import score_positions, build_points_list, build_standings_WC
+from services.data_functions import build_position_matrix, head_to_head
+
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+DEFAULT_OUTPUT = "benchmarks/baseline.json"
+
+# Athletes of a compare selection in the head-to-head case
+HEAD_TO_HEAD_ATHLETES = 10
+
+
+def _cases(df_WC, df_LC):
+
+    season = int(df_WC["Seasoncode"].max())
+    df_WC_points = df_WC.assign(WC_Points=score_positions(df_WC["Position"]))
+    df_table = build_display_table(df_WC_points)
+    min_fis = df_table["FIS Points"].replace(0, np.nan).min()
+    max_fis = df_table["FIS Points"].max()
+
+    df_season = df_WC[df_WC["Seasoncode"] == season]
+    matrix = build_position_matrix(df_season)
+    athletes = df_season["Competitorname"].astype(str).value_counts().index[:HEAD_TO_HEAD_ATHLETES].tolist()
+
+    # name -> callable, every case runs on the full synthetic frame (worst case of a selection)
+    return {
+        "prepare_results_WC": lambda: prepare_results_WC(df_WC),
+        "build_display_table": lambda: build_display_table(df_WC_points),
+        "build_display_table_compare": lambda: build_display_table(df_WC_points, compare_on=True),
+        "build_aggregates_WC": lambda: build_aggregates_WC(df_WC),
+        "build_standings_WC": lambda: build_standings_WC(df_WC),
+        "build_position_matrix": lambda: build_position_matrix(df_season),
+        "head_to_head": lambda: head_to_head(matrix, athletes),
+        "get_top_results": lambda: get_top_results(df_LC, 2),
+        "get_numbers_LC": lambda: get_numbers_LC(df_LC),
+        "build_points_list": lambda: build_points_list(df_LC, df_LC.groupby("Seasoncode")["Racedate"].max()),
+        "style_positions": lambda: style_positions(df_table["Position"]),
+        "style_status": lambda: style_status(df_table["Status"]),
+        "style_FIS_Points": lambda: style_FIS_Points(df_table["FIS Points"], min_fis, max_fis),
+    }
+
+
+def _measure(case, repeat):
+
+    # Best wall time of a few runs, peak memory of one extra traced run
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"seconds": min(timings), "peak_mb": peak / 1024**2}
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, only=None):
+
+    results = {}
+
+    for n_rows in sizes:
+        df_WC = generate_fis_results(n_rows, sector='CC')
+        df_LC = generate_fis_results(n_rows, sector='AL')
+
+        results[str(n_rows)] = {}
+        for name, case in _cases(df_WC, df_LC).items():
+            if only and name not in only:
+                continue
+
+            results[str(n_rows)][name] = _measure(case, repeat)
+            print(f"{n_rows:>10} rows  {name:<28} {results[str(n_rows)][name]['seconds']*1000:>10.1f} ms  {results[str(n_rows)][name]['peak_mb']:>8.1f} MB")
+
+        del df_WC, df_LC
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's data path on synthetic fis_results data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="Run only these benchmark cases")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.repeat, args.only)
+
+    baseline = {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(baseline, f, indent=2)
+
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
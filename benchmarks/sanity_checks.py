@@ -0,0 +1,311 @@
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_fis_results
+from services import disk_cache, swr
+from services.data_functions import build_standings_WC, update_standings_WC
+from services.data_functions import build_points_list, build_position_matrix, head_to_head
+from services.results_store import RESULT_KEY, RESULTS_COLUMNS_WC, SYNC_LOOKBACK_DAYS
+from services.results_store import compact_results, compute_watermark, read_watermark, write_results_snapshot
+from services.results_store import write_watermark, sync_results_snapshot
+
+
+# The vectorized engines against a rebuild or a brute-force loop, the snapshot sync, the
+# stale-while-revalidate cache and the disk cache against their contracts, on synthetic data.
+# Every check returns a list of failure messages (empty when the results match)
+
+DEFAULT_ROWS = 20_000
+HEAD_TO_HEAD_ATHLETES = 8
+
+# Workers racing for the same disk cache key
+CONCURRENT_LOADERS = 6
+
+
+def _frame_mismatch(name, actual, expected):
+
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    except AssertionError as error:
+        return [f"{name}: {error}"]
+
+    return []
+
+
+def check_standings_update(df):
+
+    # Incremental updates (new races, a corrected race, a race with a removed result) == full rebuild
+    race_ids = np.sort(df["Raceid"].unique())
+    initial, new = race_ids[:len(race_ids) // 2], race_ids[len(race_ids) // 2:]
+
+    standings = build_standings_WC(df[df["Raceid"].isin(initial)])
+    standings = update_standings_WC(standings, df[df["Raceid"].isin(new)])
+
+    # Correction: the top ten of one race swap places, another race loses its winner
+    corrected, removed = initial[0], initial[1]
+    df = df.copy()
+    rows = df.index[(df["Raceid"] == corrected) & df["Position"].between(1, 10)]
+    df.loc[rows, "Position"] = df.loc[rows, "Position"].to_numpy()[::-1]
+    df = df.drop(df.index[(df["Raceid"] == removed) & (df["Position"] == 1)])
+
+    standings = update_standings_WC(standings, df[df["Raceid"].isin([corrected, removed])])
+    rebuilt = build_standings_WC(df)
+
+    failures = _frame_mismatch("standings table", standings["table"], rebuilt["table"])
+    if standings["races"] != rebuilt["races"]:
+        failures.append("standings races differ from the rebuild")
+
+    return failures
+
+
+def check_points_list(df, window_days=365, best=2):
+
+    # Every (list, athlete, discipline) == mean of its best results inside the window, computed group by group
+    as_of = df.groupby("Seasoncode")["Racedate"].max()
+    points_list = build_points_list(df, as_of, window_days=window_days, best=best)
+
+    expected = {}
+    for season, end in as_of.items():
+        window = df[(df["Racedate"] <= end) & (df["Racedate"] > end - pd.Timedelta(days=window_days))].dropna(subset=["Racepoints"])
+        for (athlete, description), group in window.groupby(["Competitorname", "Description"], observed=True):
+            expected[(season, athlete, description)] = group["Racepoints"].nsmallest(best).mean()
+
+    expected = pd.Series(expected).rename_axis(["Seasoncode", "Competitorname", "Description"])
+    actual = points_list["AVG Points"]
+
+    failures = []
+    if len(actual) != len(expected):
+        failures.append(f"points list has {len(actual)} entries, brute force {len(expected)}")
+
+    difference = (actual - expected.reindex(actual.index)).abs()
+    if (difference > 1e-6).any() or difference.isna().any():
+        failures.append(f"points list differs from brute force for {int((difference > 1e-6).sum() + difference.isna().sum())} entries")
+
+    return failures
+
+
+def check_head_to_head(df, n_athletes=HEAD_TO_HEAD_ATHLETES):
+
+    # Wins, shared races and average gap of every pair == a loop over the races both finished
+    df = df[df["Seasoncode"] == df["Seasoncode"].max()]
+    athletes = df["Competitorname"].astype(str).value_counts().index[:n_athletes].tolist()
+    h2h = head_to_head(build_position_matrix(df), athletes)
+
+    positions = df[df["Position"] > 0].assign(Competitorname=lambda d: d["Competitorname"].astype(str))
+    positions = positions.pivot_table(index="Raceid", columns="Competitorname", values="Position", aggfunc="first")
+
+    failures = []
+    for a, b in itertools.permutations(athletes, 2):
+        both = positions[[a, b]].dropna()
+        wins, shared = int((both[a] < both[b]).sum()), len(both)
+        gap = (both[a] - both[b]).mean() if shared else np.nan
+
+        if h2h["wins"].loc[a, b] != wins or h2h["shared"].loc[a, b] != shared:
+            failures.append(f"head-to-head {a} vs {b}: {h2h['wins'].loc[a, b]} wins / {h2h['shared'].loc[a, b]} shared, brute force {wins} / {shared}")
+        elif not np.isclose(h2h["gap"].loc[a, b], gap, equal_nan=True, atol=1e-4):
+            failures.append(f"head-to-head {a} vs {b}: gap {h2h['gap'].loc[a, b]}, brute force {gap}")
+
+    return failures
+
+
+### STORAGE ###
+
+def _comparable(df):
+
+    # Rows in key order, categoricals as strings (merged snapshots can carry other category sets)
+    df = df[RESULTS_COLUMNS_WC].sort_values(RESULT_KEY, ignore_index=True)
+
+    return df.astype({column: str for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)})
+
+
+def check_results_sync(df):
+
+    # Snapshot of the older races, then a warehouse that gained races and corrected or removed
+    # results of recent ones: one delta sync must equal a full reload of the warehouse
+    race_ids = np.sort(df["Raceid"].unique())
+    stored = df[df["Raceid"].isin(race_ids[:len(race_ids) // 2])]
+    watermark = compute_watermark(compact_results(stored), loaded_at=time.time() - 3600)
+
+    # Correction of the newest stored race (inside the lookback window): the winner's result is
+    # removed and the next ten swap places
+    corrected = stored.loc[stored["Racedate"].idxmax(), "Raceid"]
+
+    warehouse = df.copy()
+    rows = warehouse.index[(warehouse["Raceid"] == corrected) & warehouse["Position"].between(2, 11)]
+    warehouse.loc[rows, "Position"] = warehouse.loc[rows, "Position"].to_numpy()[::-1]
+    warehouse = warehouse.drop(warehouse.index[(warehouse["Raceid"] == corrected) & (warehouse["Position"] == 1)])
+
+    def fetch_delta(watermark):
+        # Same filter as fetch_results_delta_WC
+        since = pd.Timestamp(watermark["max_racedate"]) - pd.Timedelta(days=SYNC_LOOKBACK_DAYS)
+        return warehouse[(warehouse["Raceid"] > watermark["max_raceid"]) | (warehouse["Racedate"] >= since)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, "results.parquet")
+        watermark_path = os.path.join(directory, "watermark.json")
+        write_results_snapshot(stored, snapshot_path)
+        write_watermark(watermark, watermark_path)
+
+        synced = sync_results_snapshot(fetch_delta, snapshot_path, watermark_path)
+        new_watermark = read_watermark(watermark_path)
+
+    failures = _frame_mismatch("synced snapshot", _comparable(synced), _comparable(compact_results(warehouse)))
+
+    if new_watermark["max_raceid"] != int(warehouse["Raceid"].max()):
+        failures.append(f"watermark max_raceid {new_watermark['max_raceid']}, expected {int(warehouse['Raceid'].max())}")
+    if pd.Timestamp(new_watermark["loaded_at"]) <= pd.Timestamp(watermark["loaded_at"]):
+        failures.append("watermark loaded_at did not move forward")
+
+    return failures
+
+
+def check_stale_while_revalidate(refresh_seconds=0.3):
+
+    failures = []
+    calls = []
+    running = []
+
+    @swr.stale_while_revalidate(0.05)
+    def slow(x):
+        running.append(x)
+        calls.append(len(running))
+        time.sleep(refresh_seconds)
+        running.remove(x)
+        return len(calls)
+
+    # Expired value: every caller gets the stale value right away, a single refresh runs in the background
+    slow(1)
+    time.sleep(0.1)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(8) as pool:
+        values = list(pool.map(lambda _: slow(1), range(32)))
+    elapsed = time.perf_counter() - start
+
+    if set(values) != {1}:
+        failures.append(f"callers during a refresh got {sorted(set(values))}, expected the stale value 1")
+    if elapsed > refresh_seconds / 2:
+        failures.append(f"callers during a refresh waited {elapsed:.2f}s")
+
+    time.sleep(refresh_seconds * 2)
+    if len(calls) != 2 or max(calls) != 1:
+        failures.append(f"{len(calls) - 1} refreshes ran ({max(calls)} at once), expected exactly one")
+    if slow(1) != 2:
+        failures.append("the refreshed value was not swapped in")
+
+    # Eviction: at most max_entries argument combinations, least recently used first
+    @swr.stale_while_revalidate(60, max_entries=2)
+    def bounded(x):
+        return x
+
+    for x in [1, 2, 1, 3]:
+        bounded(x)
+
+    cached = sorted(key[1][0] for key in list(swr._entries) if key[0] == bounded.__qualname__)
+    if cached != [1, 3]:
+        failures.append(f"bounded loader keeps {cached}, expected [1, 3]")
+
+    swr.clear(slow)
+    swr.clear(bounded)
+
+    return failures
+
+
+def _count_load(cache_dir, log_path):
+
+    # One racing worker: the load appends a line to the log, the result is the cached frame
+    def load():
+        with open(log_path, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        time.sleep(0.3)
+        return pd.DataFrame({"value": np.arange(1000)})
+
+    return len(disk_cache.get_or_load("concurrent", load, cache_dir=cache_dir))
+
+
+def check_disk_cache():
+
+    failures = []
+    frame = pd.DataFrame({"value": np.arange(100_000)})
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # TTL: a file older than the ttl is a miss
+        disk_cache.write_frame("ttl", frame, cache_dir=cache_dir)
+        if disk_cache.read_frame("ttl", ttl=60, cache_dir=cache_dir) is None:
+            failures.append("fresh disk cache file was not read")
+
+        written = time.time() - 120
+        os.utime(disk_cache._path("ttl", cache_dir=cache_dir), (written, written))
+        if disk_cache.read_frame("ttl", ttl=60, cache_dir=cache_dir) is not None:
+            failures.append("disk cache file older than the ttl was read")
+
+        # LRU: the least recently read files go first until the cache fits
+        for i, key in enumerate(["old", "middle", "new"]):
+            disk_cache.write_frame(key, frame, cache_dir=cache_dir)
+            path = disk_cache._path(key, cache_dir=cache_dir)
+            os.utime(path, (time.time() - 100 + i, os.stat(path).st_mtime))
+        os.remove(disk_cache._path("ttl", cache_dir=cache_dir))
+
+        size_mb = os.path.getsize(disk_cache._path("old", cache_dir=cache_dir)) / 1024**2
+        disk_cache.evict(max_mb=size_mb * 2.5, cache_dir=cache_dir)
+
+        kept = sorted(name[:-len(".arrow")] for name in os.listdir(cache_dir) if name.endswith(".arrow"))
+        if kept != ["middle", "new"]:
+            failures.append(f"eviction kept {kept}, expected ['middle', 'new']")
+
+        # Concurrent misses of one key from several processes: a single load, every worker gets its result
+        log_path = os.path.join(cache_dir, "loads.log")
+        with ProcessPoolExecutor(CONCURRENT_LOADERS) as pool:
+            rows = list(pool.map(_count_load, [cache_dir] * CONCURRENT_LOADERS, [log_path] * CONCURRENT_LOADERS))
+
+        with open(log_path) as f:
+            loads = len(f.readlines())
+
+        if loads != 1 or rows != [1000] * CONCURRENT_LOADERS:
+            failures.append(f"{CONCURRENT_LOADERS} concurrent get_or_load calls ran {loads} loads, returned {rows}")
+
+    return failures
+
+
+def run_sanity_checks(n_rows=DEFAULT_ROWS):
+
+    df_WC = generate_fis_results(n_rows, sector='CC')
+    df_LC = generate_fis_results(n_rows, sector='AL')
+
+    checks = {
+        "update_standings_WC": lambda: check_standings_update(df_WC),
+        "build_points_list": lambda: check_points_list(df_LC),
+        "head_to_head": lambda: check_head_to_head(df_WC),
+        "sync_results_snapshot": lambda: check_results_sync(df_WC),
+        "stale_while_revalidate": check_stale_while_revalidate,
+        "disk_cache": check_disk_cache,
+    }
+
+    failures = {}
+    for name, check in checks.items():
+        failures[name] = check()
+        print(f"{name:<28} {'ok' if not failures[name] else 'FAILED'}")
+        for failure in failures[name][:10]:
+            print(f"    {failure}")
+
+    return {name: messages for name, messages in failures.items() if messages}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check the engines, the snapshot sync and the caches on synthetic data")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    args = parser.parse_args()
+
+    sys.exit(1 if run_sanity_checks(args.rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
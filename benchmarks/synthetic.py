@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+# Disciplines, categories and venues per sector of the synthetic fis_results table
+SECTORS = {
+    'CC': {
+        'disciplines': [('10 km C', '10 km C'), ('Sprint F', 'SP'), ('Skiathlon', 'SA'), ('50 km F', 'MS'), ('Pursuit', 'PU')],
+        'categories': ['WC'],
+    },
+    'AL': {
+        'disciplines': [('Slalom', 'SL'), ('Giant Slalom', 'GS'), ('Super G', 'SG'), ('Downhill', 'DH'), ('Alpine Combined', 'AC')],
+        'categories': ['WC', 'EC', 'FIS', 'NC', 'NJR', 'ENL', 'TRA'],
+    },
+}
+
+NATIONS = ['SUI', 'AUT', 'NOR', 'SWE', 'FIN', 'ITA', 'FRA', 'GER', 'USA', 'CAN', 'SLO', 'CZE']
+PLACES = ['Davos', 'Lillehammer', 'Val di Fiemme', 'Lahti', 'Ruka', 'Falun', 'Engadin', 'Adelboden', 'Wengen', 'Kitzbuehel', 'Levi', 'Soelden']
+
+STARTERS_PER_RACE = 60
+
+
+def _categorical(values, categories):
+
+    return pd.Categorical.from_codes(values, categories=categories)
+
+
+def generate_fis_results(n_rows, sector='CC', first_season=2015, seed=0):
+
+    rng = np.random.default_rng(seed)
+    config = SECTORS[sector]
+
+    n_races = max(1, n_rows // STARTERS_PER_RACE)
+    n_athletes = max(100, n_rows // 200)
+    n_seasons = 10
+
+    # Races: season, date, discipline, category, venue
+    race_seasons = first_season + rng.integers(0, n_seasons, n_races)
+    race_days = rng.integers(0, 150, n_races)
+    race_dates = pd.to_datetime((race_seasons - 1).astype(str) + '-11-01') + pd.to_timedelta(race_days, unit='D')
+    race_disciplines = rng.integers(0, len(config['disciplines']), n_races)
+    race_categories = rng.integers(0, len(config['categories']), n_races)
+    race_places = rng.integers(0, len(PLACES), n_races)
+    race_nations = rng.integers(0, len(NATIONS), n_races)
+
+    # Rows: every race gets a block of consecutive starters
+    race_of_row = np.minimum(np.arange(n_rows) // STARTERS_PER_RACE, n_races - 1)
+    position = np.arange(n_rows) - np.searchsorted(race_of_row, race_of_row) + 1
+
+    # About 8% of the starters do not finish (Position 0), finishers get QLF instead of a NULL status
+    # (the warehouse queries filter on Status != 'DNS', which drops NULL rows)
+    status_codes = rng.choice(3, n_rows, p=[0.92, 0.05, 0.03])  # QLF, DNF, DSQ
+    position = np.where(status_codes >= 1, 0, position)
+    status = pd.Categorical.from_codes(status_codes, categories=['QLF', 'DNF1', 'DSQ1'])
+
+    competitor = rng.integers(0, n_athletes, n_rows)
+    athlete_nations = rng.integers(0, len(NATIONS), n_athletes)
+    athlete_gender = rng.integers(0, 2, n_athletes)
+
+    discipline_names = [name for name, _ in config['disciplines']]
+    discipline_codes = [code for _, code in config['disciplines']]
+
+    racepoints = np.where(position > 0, position * 1.7 + rng.random(n_rows) * 15, np.nan).round(2)
+
+    df = pd.DataFrame({
+        'Raceid': 100000 + race_of_row,
+        'Racedate': race_dates[race_of_row],
+        'Seasoncode': race_seasons[race_of_row],
+        'Description': _categorical(race_disciplines[race_of_row], discipline_names),
+        'Gender': _categorical(athlete_gender[competitor], ['M', 'W']),
+        'Calstatuscode': 'O',
+        'Sectorcode': sector,
+        'Competitorid': competitor,
+        'Competitorname': _categorical(competitor, [f'ATHLETE {i:06d}' for i in range(n_athletes)]),
+        'Competitor_Nationcode': _categorical(athlete_nations[competitor], NATIONS),
+        'Fiscode': 500000 + competitor,
+        'Level': 1,
+        'Teamid': 0,
+        'Disciplinename': _categorical(race_disciplines[race_of_row], discipline_names),
+        'Catname': _categorical(race_categories[race_of_row], config['categories']),
+        'IsTeamResult': False,
+        'Catcode': _categorical(race_categories[race_of_row], config['categories']),
+        'Position': position,
+        'Status': status,
+        'Racepoints': racepoints,
+        'Details': '1:02.34',
+        'Disciplinecode': _categorical(race_disciplines[race_of_row], discipline_codes),
+        'Nationcode': _categorical(race_nations[race_of_row], NATIONS),
+        'Place': _categorical(race_places[race_of_row], PLACES),
+        'Webcomment': '',
+        'Bib': rng.integers(1, 100, n_rows),
+    })
+
+    # Every athlete starts at most once per race
+    return df.drop_duplicates(subset=['Raceid', 'Competitorid'], ignore_index=True)
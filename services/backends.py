@@ -0,0 +1,224 @@
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+
+# Queries reference the results table as {fis_results} and parameters as @name,
+# list parameters are written as "IN UNNEST(@name)" (BigQuery syntax)
+BACKEND = os.environ.get("CROSSCOUNTY_BACKEND", "bigquery")
+SQLITE_PATH = os.environ.get("CROSSCOUNTY_SQLITE_PATH", "fis_results.db")
+
+# Rows per columnar batch when streaming from SQLite
+BATCH_SIZE = 50_000
+
+# Queries running at the same time per process (also the size of the HTTP connection pool)
+MAX_CONCURRENT_QUERIES = int(os.environ.get("CROSSCOUNTY_MAX_QUERIES", "4"))
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+
+    def __init__(self):
+
+        self._slots = threading.BoundedSemaphore(MAX_CONCURRENT_QUERIES)
+        self._stats_lock = threading.Lock()
+        self.stats = {"queries": 0, "total_seconds": 0.0, "recent": deque(maxlen=50)}
+
+    def query(self, query, params=None):
+
+        # Bounded concurrency, every query is timed
+        with self._slots:
+            start = time.perf_counter()
+            df = self._execute(query, params or {})
+            elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.stats["queries"] += 1
+            self.stats["total_seconds"] += elapsed
+            self.stats["recent"].append({"query": " ".join(query.split())[:120], "seconds": elapsed, "rows": len(df)})
+
+        logger.info("%s query took %.3fs (%d rows)", type(self).__name__, elapsed, len(df))
+
+        return df
+
+    def _execute(self, query, params):
+
+        raise NotImplementedError
+
+
+class BigQueryBackend(Backend):
+
+    table = "`swissski-production.raw_fis.fis_results`"
+
+    def __init__(self, service_account_info):
+
+        super().__init__()
+
+        # Imported here so the local backend does not need the Google libraries
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+        from google.oauth2 import service_account
+        from google.cloud import bigquery
+
+        self._bigquery = bigquery
+
+        credentials = service_account.Credentials.from_service_account_info(service_account_info)
+
+        # One keep-alive HTTP session with a connection per concurrent query
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=MAX_CONCURRENT_QUERIES, pool_maxsize=MAX_CONCURRENT_QUERIES)
+        session.mount("https://", adapter)
+
+        self.client = bigquery.Client(credentials=credentials, project=credentials.project_id, _http=session)
+
+    def _execute(self, query, params):
+
+        job_config = self._bigquery.QueryJobConfig(query_parameters=[
+            self._parameter(name, value) for name, value in params.items()
+        ])
+
+        query_job = self.client.query(query.format(fis_results=self.table), job_config=job_config)
+
+        # Arrow record batches straight into columns instead of one dict per row
+        return query_job.result().to_arrow().to_pandas()
+
+    def _parameter(self, name, value):
+
+        if isinstance(value, (list, tuple)):
+            element_type = _bigquery_type(value[0]) if len(value) else "STRING"
+            return self._bigquery.ArrayQueryParameter(name, element_type, list(value))
+
+        return self._bigquery.ScalarQueryParameter(name, _bigquery_type(value), value)
+
+
+class SQLiteBackend(Backend):
+
+    table = "fis_results"
+
+    def __init__(self, path=SQLITE_PATH):
+
+        super().__init__()
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+
+        # SQLite connections must not be shared between threads, keep one open per thread
+        if not hasattr(self._local, "connection"):
+            self._local.connection = sqlite3.connect(self.path)
+
+        return self._local.connection
+
+    def _execute(self, query, params):
+
+        query, params = _to_sqlite(query.format(fis_results=self.table), params)
+
+        # sqlite3 keeps the prepared statement of every distinct query text
+        cursor = self.connection.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+
+        batches = []
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            batches.append(pa.table({column: values for column, values in zip(columns, zip(*rows))}))
+
+        if not batches:
+            return pd.DataFrame(columns=columns)
+
+        return pa.concat_tables(batches, promote_options="default").to_pandas()
+
+
+def _bigquery_type(value):
+
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    if isinstance(value, float):
+        return "FLOAT64"
+    if isinstance(value, datetime.datetime):
+        return "TIMESTAMP"
+    if isinstance(value, datetime.date):
+        return "DATE"
+    return "STRING"
+
+
+def _to_sqlite(query, params):
+
+    sqlite_params = {}
+
+    # IN UNNEST(@names) -> IN (:names_0, :names_1, ...)
+    def expand(match):
+        name = match.group(1)
+        values = list(params[name]) or [None]
+        for i, value in enumerate(values):
+            sqlite_params[f"{name}_{i}"] = value
+        return "IN (" + ", ".join(f":{name}_{i}" for i in range(len(values))) + ")"
+
+    query = re.sub(r"IN UNNEST\(@(\w+)\)", expand, query)
+    query = re.sub(r"@(\w+)", r":\1", query)
+
+    for name, value in params.items():
+        if not isinstance(value, (list, tuple)):
+            sqlite_params[name] = value.isoformat() if isinstance(value, datetime.date) else value
+
+    return query, sqlite_params
+
+
+def backend_configured():
+
+    # True if get_backend() can connect: the SQLite file exists or the BigQuery secrets are set
+    if BACKEND == "sqlite":
+        return os.path.exists(SQLITE_PATH)
+
+    try:
+        return "gbq_service_account" in st.secrets
+    except FileNotFoundError:
+        # No secrets.toml at all (StreamlitSecretNotFoundError is a FileNotFoundError)
+        return False
+
+
+@st.cache_resource(show_spinner=False)
+def get_backend():
+
+    # One client per process, shared by all sessions and reruns
+    if BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+
+    return BigQueryBackend(st.secrets["gbq_service_account"])
+
+
+def build_sqlite_standin(csv_path, db_path=SQLITE_PATH):
+
+    # Local copy of the fis_results table for offline runs and load tests
+    df = pd.read_csv(csv_path)
+
+    with sqlite3.connect(db_path) as connection:
+        df.to_sql("fis_results", connection, if_exists="replace", index=False)
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_sector_season ON fis_results (Sectorcode, Seasoncode)")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_competitor ON fis_results (Competitorname)")
+
+    return len(df)
+
+
+if __name__ == "__main__":
+    # python -m services.backends results.csv [fis_results.db]
+    import sys
+
+    print(f"Wrote {build_sqlite_standin(*sys.argv[1:3])} rows")
@@ -0,0 +1,198 @@
+import math
+import os
+
+import numpy as np
+
+from services.data_functions import color_mapping_disciplines, symbol_map
+from services.memo import LRUCache
+
+
+# Built figures per (chart, data version, selection), shared by all sessions
+FIGURE_CACHE = LRUCache(64)
+
+# Line colours of the athletes in compare mode (plotly's default qualitative sequence)
+LINE_COLORS = ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A', '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52']
+
+MARGIN = dict(l=20, r=20, t=50, b=20)
+
+# Line charts with more points than the budget are decimated (LTTB) to at most that many points,
+# text labels are only drawn below the label budget, larger charts render with WebGL
+POINT_BUDGET = int(os.environ.get("CROSSCOUNTY_POINT_BUDGET", "2000"))
+TEXT_LABEL_BUDGET = int(os.environ.get("CROSSCOUNTY_TEXT_LABEL_BUDGET", "150"))
+
+
+def get_figure(key, build_spec):
+
+    # Validated once on a miss, reruns with the same data and selection reuse the figure
+    def build():
+        import plotly.graph_objects as go
+        return go.Figure(build_spec())
+
+    return FIGURE_CACHE.get_or_build(key, build)
+
+
+### OVERVIEW ###
+
+def discipline_bar_spec(labels, values, y_title, height):
+
+    # One bar per discipline, coloured by discipline, values above the bars
+    labels = [str(label) for label in labels]
+
+    return {
+        "data": [{
+            "type": "bar",
+            "x": labels,
+            "y": list(values),
+            "texttemplate": "%{y}",
+            "textposition": "outside",
+            "marker": {"color": [color_mapping_disciplines.get(label, "gray") for label in labels], "opacity": 0.6},
+            "hovertemplate": f"Discipline=%{{x}}<br>{y_title}=%{{y}}<extra></extra>",
+            "showlegend": False,
+        }],
+        "layout": {
+            "height": height,
+            "margin": MARGIN,
+            "showlegend": False,
+            "xaxis": {"title": {"text": "Discipline"}},
+            "yaxis": {"title": {"text": y_title}},
+        },
+    }
+
+
+def podium_donut_spec(counts, count_all):
+
+    # Wins, seconds and thirds with the number of races in the hole
+    return {
+        "data": [{
+            "type": "pie",
+            "labels": ['Wins', 'Seconds', 'Thirds'],
+            "values": counts,
+            "hole": .5,
+            "marker": {"colors": ['gold', 'silver', 'chocolate']},
+            "textinfo": "label+value",
+        }],
+        "layout": {
+            "height": 400,
+            "annotations": [{"text": f'#{count_all} in Total', "x": 0.5, "y": 0.5, "font": {"size": 20}, "showarrow": False, "xanchor": "center"}],
+            "legend": {"orientation": "h", "yanchor": "bottom", "y": -0.1, "xanchor": "center", "x": 0.5},
+            "margin": MARGIN,
+        },
+    }
+
+
+### LINE CHARTS ###
+
+def lttb_indices(x, y, threshold):
+
+    # Largest-Triangle-Three-Buckets: keeps first and last point plus, per bucket, the point
+    # spanning the largest triangle with the previous kept point and the next bucket's mean
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = stop, edges[i + 2] if i + 2 < len(edges) else n
+        mean_x = x[next_start:next_stop].mean()
+        mean_y = y[next_start:next_stop].mean()
+
+        areas = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous]) - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+
+    return kept
+
+
+def _decimate(group, y, budget):
+
+    if len(group) <= budget:
+        return group
+
+    positions = lttb_indices(group["Racedate"].to_numpy().astype("datetime64[ns]").astype(np.int64), group[y].to_numpy(), budget)
+    return group.iloc[positions]
+
+
+def _symbol_legend_traces():
+
+    # Dummy traces that only show the discipline symbols in the legend
+    return [{
+        "type": "scatter",
+        "x": [None],
+        "y": [None],
+        "mode": "markers",
+        "marker": {"size": 13, "symbol": symbol, "color": "black"},
+        "name": discipline,
+    } for discipline, symbol in symbol_map.items()]
+
+
+def results_line_spec(df, y, y_title, hover_label, compare_on, symbols=False, top_line=None, point_budget=POINT_BUDGET):
+
+    # One line per athlete (a single unnamed line without compare), one point per race
+    if compare_on:
+        groups = list(df.groupby("Competitorname", observed=True, sort=False))
+    else:
+        groups = [(None, df)]
+
+    # Past the label budget the labels are dropped and the traces switch to WebGL,
+    # past the point budget every athlete keeps an equal share of LTTB-selected points
+    labels_on = len(df) <= TEXT_LABEL_BUDGET
+    trace_type = "scatter" if labels_on else "scattergl"
+    athlete_budget = max(3, point_budget // max(1, len(groups)))
+
+    traces = []
+    for i, (athlete, group) in enumerate(groups):
+        group = _decimate(group, y, athlete_budget)
+        values = group[y].to_numpy()
+        marker_symbols = group["Disciplinecode"].map(symbol_map).astype(object).fillna("circle").to_numpy() if symbols else "circle"
+
+        trace = {
+            "type": trace_type,
+            "mode": "lines+markers+text" if labels_on else "lines+markers",
+            "x": group["Racedate"].to_numpy(),
+            "y": values,
+            "line": {"color": LINE_COLORS[i % len(LINE_COLORS)]},
+            "marker": {"size": 13 if labels_on else 8, "symbol": marker_symbols, "color": "black"},
+            "customdata": group[["Disciplinecode", "Place"]].astype(object).to_numpy(),
+            "hovertemplate": "<b>Date:</b> %{x}<br>"
+                             f"<b>{hover_label}:</b> %{{y}}<br>"
+                             "<b>Discipline:</b> %{customdata[0]}<br>"
+                             "<b>Place:</b> %{customdata[1]}<extra></extra>",
+            "name": "" if athlete is None else str(athlete),
+            "showlegend": athlete is not None,
+        }
+
+        if labels_on:
+            trace.update({"text": values, "textposition": "bottom center", "textfont": {"size": 15, "color": "black"}})
+
+        traces.append(trace)
+
+    # Reversed y-axis (best at the top) that always covers the worst value
+    max_value = df[y].max()
+    max_range = math.ceil((0 if math.isnan(max_value) else max_value) / 10.0) * 10
+
+    layout = {
+        "xaxis": {"title": {"text": "Racedate"}, "tickformat": "%d-%m-%Y"},
+        "yaxis": {
+            "title": {"text": y_title},
+            "range": [max_range + 11, 0],
+            "tick0": 5, "dtick": 5,
+            "showgrid": True, "gridcolor": "lightgray", "gridwidth": 0.5,
+        },
+        "legend": {"orientation": "h", "yanchor": "bottom", "y": 1.1, "xanchor": "center", "x": 0.5},
+    }
+
+    if top_line is not None:
+        layout["shapes"] = [{
+            "type": "line", "xref": "x domain", "x0": 0, "x1": 1, "yref": "y", "y0": top_line, "y1": top_line,
+            "line": {"dash": "dash", "color": "black"},
+        }]
+
+    return {"data": traces + _symbol_legend_traces(), "layout": layout}
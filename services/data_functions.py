@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
-import matplotlib.colors as mcolors
+
+from services.tracing import traced
+from services.memo import LRUCache
 
 
 rank_points_mapping = {
@@ -31,176 +33,425 @@ symbol_map = {
 }
 
 
-def count_results(df):
-
-    # Count how many times the athlete has been in the top 10
-    cnt_first_place = len(df[df["Position"] == 1])
-    cnt_second_place = len(df[df["Position"] == 2])
-    cnt_third_place = len(df[df["Position"] == 3])
-
-    count_all = len(df)
-    
-    return [cnt_first_place, cnt_second_place, cnt_third_place], count_all
-
-def transform_results(df, compare_on = False, FIS = False):
-
-    if not compare_on:
-
-        df = df.drop(columns=[
-                            'Seasoncode',
-                            'Description',
-                            'Gender',
-                            'Calstatuscode',
-                            'Sectorcode',
-                            'Competitorid',
-                            'Competitorname',  
-                            'Competitor_Nationcode',
-                            'Fiscode',
-                            'Level',
-                            'Teamid',
-                            'Disciplinename',
-                            'Catname',
-                            'Sectorcode',
-                            'IsTeamResult',
-                        ])
-        
-    else:
+TRANSPARENT_STYLE = 'background-color: rgba(0, 0, 0, 0)'
 
-        df = df.drop(columns=[
-                    'Seasoncode',
-                    'Description',
-                    'Gender',
-                    'Calstatuscode',
-                    'Sectorcode',
-                    'Competitorid',  
-                    'Competitor_Nationcode',
-                    'Fiscode',
-                    'Level',
-                    'Teamid',
-                    'Disciplinename',
-                    'Catname',
-                    'Sectorcode',
-                    'IsTeamResult',
-                ])
-        
-    if not FIS:
+# Colour lookup table for the FIS points gradient (blue -> white), same steps as a 256 colour colormap
+FIS_GRADIENT_STEPS = 256
+FIS_GRADIENT_START = np.array([0/255, 102/255, 255/255])
+FIS_GRADIENT_END = np.array([1.0, 1.0, 1.0])
 
-        df = df.drop(columns=['Catcode'])
-    
-    #Transform 0 to Null in Position
-    df['Position'] = df['Position'].replace(0, None)
+_fis_gradient_rgb = (np.linspace(0, 1, FIS_GRADIENT_STEPS)[:, None] * (FIS_GRADIENT_END - FIS_GRADIENT_START) + FIS_GRADIENT_START)
+_fis_gradient_rgb = (_fis_gradient_rgb * 255).astype(int)
 
-    #Transform QLF to Null in Status
-    df['Status'] = df['Status'].replace("QLF", None)
+FIS_GRADIENT_STYLES = np.array([f'background-color: rgba({r}, {g}, {b}, 0.8)' for r, g, b in _fis_gradient_rgb], dtype=object)
 
-    #Rename colum
-    df = df.rename(columns={
-                        "Raceid": "RaceID",
-                        "WC_Points": "WC Points",
-                        "Racepoints": "FIS Points",
-                        "Details": "Racetime",
-                        "Disciplinecode": "Discipline",
-                        "Nationcode": "Country",
-                    })
 
-    return df
+### DISPLAY TABLES ###
 
-def get_card_metrics_WC(df, df_cards, season_select):
+DISPLAY_NAMES = {
+    "Raceid": "RaceID",
+    "WC_Points": "WC Points",
+    "Racepoints": "FIS Points",
+    "Details": "Racetime",
+    "Disciplinecode": "Discipline",
+    "Nationcode": "Country",
+}
+
+# Only the Lower Cup tables (FIS points) show the category of the race
+RACE_CATEGORY_COLUMNS_LC = ['Catcode']
 
-    df = df[df["Position"] != 0]
+# Finished tables of recent selections, shared by all sessions
+DISPLAY_TABLE_CACHE = LRUCache(maxsize=64)
 
-    count_Top3 = len(df[df["Position"] <= 3])
-    count_Top10 = len(df[(df["Position"] <= 10) & (df["Position"] > 3)])
-    count_Top30 = len(df[(df["Position"] <= 30) & (df["Position"] > 10)])
+def display_columns(compare_on=False, FIS=False):
 
-    df_cards = df_cards[df_cards["Position"] != 0]
-    df_cards = df_cards[df_cards["Seasoncode"] == season_select-1]
+    # Raw columns of the results table in display order
+    columns = ['Raceid', 'Racedate', 'Place', 'Nationcode']
+    if FIS:
+        columns += RACE_CATEGORY_COLUMNS_LC
+    columns.append('Disciplinecode')
+    if compare_on:
+        columns.append('Competitorname')
+    columns += ['Webcomment', 'Bib', 'Position']
 
-    if df_cards.empty:
-        return [count_Top3, count_Top10, count_Top30], [0, 0, 0]
-    
+    if FIS:
+        columns += ['Racepoints', 'Status', 'Details']
     else:
-        prev_count_Top3 = len(df_cards[df_cards["Position"] <= 3])
-        prev_count_Top10 = len(df_cards[(df_cards["Position"] <= 10) & (df_cards["Position"] > 3)])
-        prev_count_Top30 = len(df_cards[(df_cards["Position"] <= 30) & (df_cards["Position"] > 10)])
-
-        return [count_Top3, count_Top10, count_Top30], [count_Top3-prev_count_Top3, count_Top10-prev_count_Top10, count_Top30-prev_count_Top30]
-
-def highlight_positions(val):
-    if pd.isna(val):  
-        return 'background-color: rgba(0, 0, 0, 0)' 
-    elif val <= 3:
-        return 'background-color: rgba(0, 102, 255, 0.8)' 
-    elif val > 3 and val <= 10:
-        return 'background-color: rgba(102, 163, 255, 0.8)'
-    elif val >= 11 and val <= 30:
-        return 'background-color: rgba(204, 224, 255, 0.8)'
-    return ''  # Default style
-
-def highlight_status(val):
-    if pd.isna(val):  
-        return 'background-color: rgba(0, 0, 0, 0)' 
-    elif "DNF" in val:
-        return 'background-color: rgb(255, 153, 153); color: black'
-    return ''  # Default style
-
-def highlight_FIS_Points2(val):
-    if pd.isna(val):  
-        return 'background-color: rgba(0, 0, 0, 0)' 
-    elif val <= 20:
-        return 'background-color: rgba(0, 102, 255, 0.8)' 
-    elif val > 20 and val <= 30:
-        return 'background-color: rgba(102, 163, 255, 0.8)'
-    elif val >= 30 and val <= 40:
-        return 'background-color: rgba(204, 224, 255, 0.8)'
-    return ''  # Default style
-
-
-def highlight_FIS_Points(val, min_val, max_val):
-    if pd.isna(val) or val == 0:  
-        return 'background-color: rgba(0, 0, 0, 0)'  # Transparent for None/0 values
-
-    max_val = max_val + (max_val*0.1) 
-
-    # Normalize val to range between 0 and 1
-    norm = (val - min_val) / (max_val - min_val) if max_val > min_val else 0
-    
-    # Define a colormap from light blue to white
-    cmap = mcolors.LinearSegmentedColormap.from_list("blue_white", [(0/255, 102/255, 255/255), (1, 1, 1)])  # Light blue → White
-    
-    # Get the color from colormap
-    rgba = cmap(norm)  # Returns (r, g, b, a) tuple
-
-    # Convert to CSS rgba format, keeping alpha at 0.8
-    return f'background-color: rgba({int(rgba[0]*255)}, {int(rgba[1]*255)}, {int(rgba[2]*255)}, 0.8)'
-
-
-
-
-def get_top2_results(df, discipline, number):
-
-    df_results = df.loc[df["Description"] == discipline].nsmallest(2, "Racepoints").reset_index(drop=True)
-    length = len(df_results)
-
-    df_results["Racedate"] = pd.to_datetime(df_results["Racedate"]).dt.strftime("%d.%m.%Y")
-
-    if number == 1:
-        if length >= 1:
-            return df_results["Racepoints"][0], df_results["Place"][0], df_results["Racedate"][0]
-        else:
-            return -1, None, None
-
-    elif number == 2:
-        if length == 2:
-            return df_results["Racepoints"][1], df_results["Place"][1], df_results["Racedate"][1]
-        else:
-            return -1, None, None
+        columns += ['Status', 'Details', 'WC_Points', 'Racepoints']
+
+    return columns
+
+@traced
+def build_display_table(df, compare_on=False, FIS=False):
+
+    # Results in race order with display names, every column is copied only once
+    order = df["Racedate"].reset_index(drop=True).sort_values(kind="stable").index.to_numpy()
+
+    table = {}
+    for column in display_columns(compare_on, FIS):
+        if column not in df.columns:
+            continue
+
+        values = df[column].array.take(order)
+
+        if column == "Position":
+            # 0 means no ranking -> empty cell
+            values = pd.to_numeric(pd.Series(values), errors="coerce").astype("Int64")
+            values = values.mask(values == 0).array
+        elif column == "Status":
+            # QLF is not a result -> empty cell
+            values = pd.Series(values).mask(pd.Series(values) == "QLF").array
+
+        table[DISPLAY_NAMES.get(column, column)] = values
+
+    return pd.DataFrame(table)
+
+def get_display_table(key, build):
+
+    # key identifies data version and selection, e.g. (version, athletes, season, disciplines, categories, compare_on),
+    # build is only called (filter + build_display_table) when the key is not cached yet
+    return DISPLAY_TABLE_CACHE.get_or_build(key, build)
+
+### AGGREGATES ###
+
+AGGREGATE_COLUMNS_WC = ['Races', 'Wins', 'Seconds', 'Thirds', 'Finished', 'Top3', 'Top10', 'Top30', 'WC_Points']
+
+@traced
+def build_aggregates_WC(df):
+
+    position = df["Position"]
+
+    # One row per result with all the counters as 0/1 flags, summed in a single groupby
+    flags = pd.DataFrame({
+        "Competitorname": df["Competitorname"],
+        "Seasoncode": df["Seasoncode"],
+        "Description": df["Description"],
+        "Races": 1,
+        "Wins": (position == 1).astype(int),
+        "Seconds": (position == 2).astype(int),
+        "Thirds": (position == 3).astype(int),
+        "Finished": (position != 0).astype(int),
+        "Top3": ((position > 0) & (position <= 3)).astype(int),
+        "Top10": ((position > 3) & (position <= 10)).astype(int),
+        "Top30": ((position > 10) & (position <= 30)).astype(int),
+        "WC_Points": score_positions(position),
+    })
+
+    return flags.groupby(["Competitorname", "Seasoncode", "Description"], observed=True).sum()
+
+def get_athlete_aggregates_WC(aggregates, athlete):
+
+    # Aggregates of one athlete indexed by (Seasoncode, Description)
+    try:
+        return aggregates.loc[athlete]
+    except KeyError:
+        return aggregates.iloc[0:0].droplevel("Competitorname")
+
+def filter_aggregates_WC(df_athlete, season=None, descriptions=None):
+
+    # No season sums up the whole career
+    if season is not None:
+        df_athlete = df_athlete[df_athlete.index.get_level_values("Seasoncode") == season]
+
+    if descriptions is not None:
+        df_athlete = df_athlete[df_athlete.index.get_level_values("Description").isin(descriptions)]
+
+    return df_athlete
+
+@traced
+def get_card_metrics_from_aggregates_WC(df_athlete, season_select, descriptions):
+
+    current = filter_aggregates_WC(df_athlete, season_select, descriptions).sum()
+    previous = filter_aggregates_WC(df_athlete, season_select-1, descriptions).sum()
+
+    counts = [int(current["Top3"]), int(current["Top10"]), int(current["Top30"])]
+
+    # No finished race in the previous season means nothing to compare against
+    if previous["Finished"] == 0:
+        return counts, [0, 0, 0]
+
+    return counts, [counts[0]-int(previous["Top3"]), counts[1]-int(previous["Top10"]), counts[2]-int(previous["Top30"])]
+
+
+### STANDINGS ###
+
+# WC points by finishing position as a lookup table (index = position), positions outside 1-30 score 0
+WC_POINTS_LUT = np.array([rank_points_mapping.get(position, 0) for position in range(max(rank_points_mapping) + 1)], dtype=np.int16)
+
+OVERALL_STANDINGS = "Overall Standings"
+STANDINGS_LEVELS = ["Seasoncode", "Description", "Competitorname"]
+
+def score_positions(position):
+
+    # Vectorized rank_points_mapping lookup
+    position = np.asarray(pd.Series(position).fillna(0), dtype=np.int64)
+    inside = (position > 0) & (position < len(WC_POINTS_LUT))
+
+    return np.where(inside, WC_POINTS_LUT[np.where(inside, position, 0)], 0)
+
+def score_results_WC(df):
+
+    # Every result that scores WC points, the rest cannot change the standings
+    points = score_positions(df["Position"])
+    scored = points > 0
+
+    return pd.DataFrame({
+        "Raceid": df["Raceid"].to_numpy()[scored],
+        "Seasoncode": df["Seasoncode"].to_numpy()[scored],
+        "Description": df["Description"].astype(str).to_numpy()[scored],
+        "Competitorname": df["Competitorname"].astype(str).to_numpy()[scored],
+        "WC_Points": points[scored].astype(np.int32),
+    })
+
+def _sum_points(scored):
+
+    # Points per (season, discipline, athlete) plus the overall standings of the season
+    per_discipline = scored.groupby(STANDINGS_LEVELS)["WC_Points"].sum()
+    overall = scored.groupby(["Seasoncode", "Competitorname"])["WC_Points"].sum()
+    overall = pd.concat({OVERALL_STANDINGS: overall}, names=["Description"]).reorder_levels(STANDINGS_LEVELS)
+
+    return pd.concat([per_discipline, overall])
+
+def _rank_standings(points):
+
+    standings = points.groupby(level=["Seasoncode", "Description"], sort=False)
+
+    return pd.DataFrame({
+        "WC_Points": points,
+        "Rank": standings.rank(method="min", ascending=False).astype("int32"),
+        "Gap": standings.transform("max") - points,
+    }).sort_index()
+
+@traced
+def build_standings_WC(df):
+
+    # Scores every result once, the table is indexed by (Seasoncode, Description, Competitorname)
+    scored = score_results_WC(df)
+
+    return {"scored": scored, "races": set(df["Raceid"].unique().tolist()), "table": _rank_standings(_sum_points(scored))}
+
+@traced
+def update_standings_WC(standings, df_races):
+
+    # df_races holds all results of new or corrected races, their previous points (if any) are replaced
+    race_ids = df_races["Raceid"].unique()
+    previous = standings["scored"]
+    replaced = previous["Raceid"].isin(race_ids)
+
+    added = score_results_WC(df_races)
+    delta = _sum_points(added).sub(_sum_points(previous[replaced]), fill_value=0)
+    if delta.empty:
+        return standings
+
+    points = standings["table"]["WC_Points"].add(delta, fill_value=0).astype("int32")
+    points = points[points > 0]
+
+    # Only the standings the races touched are ranked again
+    touched = delta.index.droplevel("Competitorname").unique()
+    keep = ~standings["table"].index.droplevel("Competitorname").isin(touched)
+    rerank = points.index.droplevel("Competitorname").isin(touched)
+
+    return {
+        "scored": pd.concat([previous[~replaced], added], ignore_index=True),
+        "races": standings["races"] | set(race_ids.tolist()),
+        "table": pd.concat([standings["table"][keep], _rank_standings(points[rerank])]).sort_index(),
+    }
+
+def lookup_standing(standings, season, athlete, description=OVERALL_STANDINGS):
 
+    # (rank, points, gap to the leader), None without WC points
+    try:
+        row = standings["table"].loc[(season, description, athlete)]
+    except KeyError:
+        return None
+
+    return int(row["Rank"]), int(row["WC_Points"]), int(row["Gap"])
+
+
+### HEAD TO HEAD ###
+
+# Races per block when counting pairwise wins, bounds the (races x athletes x athletes) temporary
+HEAD_TO_HEAD_CHUNK = 256
+
+@traced
+def build_position_matrix(df):
+
+    # (race x athlete) positions, NaN where the athlete did not start or did not finish (Position 0)
+    race_codes, races = pd.factorize(df["Raceid"], sort=True)
+    athlete_codes, athletes = pd.factorize(df["Competitorname"].astype(str), sort=True)
+
+    positions = np.full((len(races), len(athletes)), np.nan, dtype=np.float32)
+    finished = df["Position"].to_numpy() > 0
+    positions[race_codes[finished], athlete_codes[finished]] = df["Position"].to_numpy()[finished]
+
+    # Discipline of every race, so one matrix serves all discipline filters
+    descriptions = pd.Series(df["Description"].astype(str).to_numpy()).groupby(race_codes).first()
+
+    return {"positions": positions, "races": races, "athletes": pd.Index(athletes), "descriptions": descriptions.to_numpy()}
+
+@traced
+def head_to_head(matrix, athletes, descriptions=None):
+
+    # Pairwise wins, shared races and average position gap (row athlete minus column athlete)
+    columns = matrix["athletes"].get_indexer(athletes)
+    athletes = [athlete for athlete, column in zip(athletes, columns) if column >= 0]
+    positions = matrix["positions"][:, columns[columns >= 0]]
+
+    if descriptions is not None:
+        positions = positions[np.isin(matrix["descriptions"], descriptions)]
+
+    finished = ~np.isnan(positions)
+    finished_f = finished.astype(np.float32)
+    filled = np.where(finished, positions, 0).astype(np.float32)
+
+    shared = finished_f.T @ finished_f
+
+    # Sum over shared races of (own position - opponent position), divided by the shared races
+    gap_sum = filled.T @ finished_f - finished_f.T @ filled
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gap = np.where(shared > 0, gap_sum / shared, np.nan)
+
+    # Row athlete ahead of column athlete in a race both finished (NaN compares False), counted block by block
+    wins = np.zeros(shared.shape, dtype=np.int32)
+    for start in range(0, len(positions), HEAD_TO_HEAD_CHUNK):
+        block = positions[start:start + HEAD_TO_HEAD_CHUNK]
+        wins += (block[:, :, None] < block[:, None, :]).sum(axis=0, dtype=np.int32)
+
+    frame = lambda values: pd.DataFrame(values, index=athletes, columns=athletes)
+
+    return {"wins": frame(wins), "losses": frame(wins.T), "shared": frame(shared.astype(np.int32)), "gap": frame(gap)}
+
+def head_to_head_table(h2h):
+
+    # "wins-losses (avg gap)" per pair, empty on the diagonal and for pairs without a shared race
+    wins, losses, shared, gap = (h2h[name].to_numpy() for name in ("wins", "losses", "shared", "gap"))
+
+    cells = np.array([f"{w}-{l} ({g:+.1f})" for w, l, g in zip(wins.ravel(), losses.ravel(), np.nan_to_num(gap).ravel())], dtype=object)
+    cells[(shared.ravel() == 0) | np.eye(len(wins), dtype=bool).ravel()] = ""
+
+    return pd.DataFrame(cells.reshape(wins.shape), index=h2h["wins"].index, columns=h2h["wins"].columns)
+
+
+### POINTS LIST ###
+
+# FIS points list style metric: average of the best two results per discipline inside a rolling window
+POINTS_LIST_BEST = 2
+POINTS_LIST_WINDOW_DAYS = 365
+
+POINTS_LIST_KEYS = ["Competitorname", "Description"]
+
+@traced
+def build_points_list(df, as_of, window_days=POINTS_LIST_WINDOW_DAYS, best=POINTS_LIST_BEST):
+
+    # as_of maps a key to the list date (e.g. Seasoncode -> last race of the season), one list per key
+    key = as_of.index.name or "List"
+    df = df.loc[df["Racepoints"].notna(), ["Competitorname", "Competitor_Nationcode", "Description", "Racedate", "Racepoints"]]
+
+    # Rows inside each window, tagged with the key of the list (a row can fall into two windows)
+    dates = pd.to_datetime(df["Racedate"]).to_numpy()
+    window = np.timedelta64(window_days, "D")
+    windows = []
+    for list_key, end in as_of.items():
+        end = pd.Timestamp(end).to_datetime64()
+        windows.append(df[(dates <= end) & (dates > end - window)].assign(**{key: list_key}))
+
+    df = pd.concat(windows, ignore_index=True)
+
+    # Best results first within every (list, athlete, discipline), then keep the head of each group
+    df = df.sort_values([key] + POINTS_LIST_KEYS + ["Racepoints"], kind="stable")
+    df = df[df.groupby([key] + POINTS_LIST_KEYS, observed=True, sort=False).cumcount() < best]
+
+    points_list = df.groupby([key] + POINTS_LIST_KEYS, observed=True).agg(
+        **{"AVG Points": ("Racepoints", "mean"), "Results": ("Racepoints", "size"), "Nation": ("Competitor_Nationcode", "first")}
+    )
+
+    # Lower points are better, rank 1 is the best athlete of the nation in the discipline
+    points_list["Nation Rank"] = (points_list.groupby([key, "Nation", "Description"], observed=True)["AVG Points"]
+                                  .rank(method="min").astype("int32"))
+
+    return points_list
+
+
+### VECTORIZED STYLING ###
+
+@traced
+def style_positions(col):
+
+    values = pd.to_numeric(col, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+    return np.select(
+        [np.isnan(values), values <= 3, (values > 3) & (values <= 10), (values >= 11) & (values <= 30)],
+        [TRANSPARENT_STYLE, 'background-color: rgba(0, 102, 255, 0.8)', 'background-color: rgba(102, 163, 255, 0.8)', 'background-color: rgba(204, 224, 255, 0.8)'],
+        default=''
+    )
+
+@traced
+def style_status(col):
+
+    missing = col.isna().to_numpy()
+    dnf = col.astype(str).str.contains("DNF", regex=False).to_numpy() & ~missing
+
+    return np.select(
+        [missing, dnf],
+        [TRANSPARENT_STYLE, 'background-color: rgb(255, 153, 153); color: black'],
+        default=''
+    )
+
+@traced
+def style_FIS_Points(col, min_val=None, max_val=None):
+
+    values = pd.to_numeric(col, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+    # Defaults to the range of the styled column (0 means no points)
+    valid = values[~np.isnan(values)]
+    if min_val is None:
+        min_val = valid[valid != 0].min() if np.any(valid != 0) else np.nan
+    if max_val is None:
+        max_val = valid.max() if len(valid) else np.nan
+
+    max_val = max_val + (max_val*0.1)
+
+    # Normalize to [0, 1] and look the colour up in the precomputed table
+    if max_val > min_val:
+        norm = (values - min_val) / (max_val - min_val)
     else:
-        st.error("Invalid number. Please choose 1 or 2.")
+        norm = np.zeros(len(values))
+
+    steps = np.clip(np.floor(np.nan_to_num(norm) * FIS_GRADIENT_STEPS), 0, FIS_GRADIENT_STEPS - 1).astype(int)
+    styles = FIS_GRADIENT_STYLES[steps]
+
+    return np.where(np.isnan(values) | (values == 0), TRANSPARENT_STYLE, styles)
+
+
+
+@traced
+def get_top_results(df, n=2):
+
+    # Best n results (lowest FIS points) of every discipline in one pass, indexed by (Description, Rank)
+    df = df.loc[df["Racepoints"].notna(), ["Description", "Racepoints", "Place", "Racedate"]]
+    df = df.sort_values(["Description", "Racepoints"], kind="stable")
+
+    rank = df.groupby("Description", observed=True, sort=False).cumcount() + 1
+    df = df[rank <= n].assign(Rank=rank[rank <= n])
+
+    # Racedate is parsed at ingestion, only the few kept rows are formatted
+    df["Racedate"] = df["Racedate"].dt.strftime("%d.%m.%Y")
+
+    return df.set_index(["Description", "Rank"])
+
+def top_result(top_results, discipline, number):
+
+    # (points, place, date) of the number-th best result, -1 points if there is none
+    try:
+        row = top_results.loc[(discipline, number)]
+    except KeyError:
+        return -1, None, None
+
+    return row["Racepoints"], row["Place"], row["Racedate"]
 
 
 
+@traced
 def get_numbers_LC(df):
 
     df = df[df["Catcode"] != "TRA"]
@@ -1,30 +1,73 @@
+import os
+import datetime
+import threading
 import streamlit as st
 import pandas as pd
 
-'''
-from google.oauth2 import service_account
-from google.cloud import bigquery
+from services.results_store import RESULTS_CSV_WC, RESULTS_SNAPSHOT_WC, RESULTS_COLUMNS_WC, SYNC_LOOKBACK_DAYS
+from services.results_store import read_results_snapshot, convert_csv_to_snapshot, write_results_snapshot
+from services.results_store import sync_results_snapshot, write_watermark, compute_watermark, compact_season_LC
+from services.results_store import snapshot_lock, watermark_loaded_at, frame_version
+from services.results_index import build_results_index, select_results
+from services.data_functions import build_aggregates_WC, build_points_list, build_standings_WC, update_standings_WC
+from services.data_functions import build_position_matrix, score_positions
+from services.tracing import traced
+from services.swr import stale_while_revalidate, in_refresh, report_data_time
+from services.projections import SEASON_COLUMNS_LC, select_list
 
-    
-def load_datapool(query):
-    
-    credentials = service_account.Credentials.from_service_account_info(st.secrets["gbq_service_account"])
-    client = bigquery.Client(credentials=credentials, project=credentials.project_id)
+from services.backends import BACKEND, get_backend
+from services.disk_cache import DISK_CACHE_TTL_SECONDS, REFRESH_DISK_CACHE_TTL_SECONDS, cache_key, get_or_load
 
-    query_job = client.query(query)
-    rows_raw = query_job.result()
-    rows = [dict(row) for row in rows_raw]
-    return pd.DataFrame(rows)
 
-'''
+@traced
+def load_datapool(query, params=None, ttl=DISK_CACHE_TTL_SECONDS):
+
+    # Parameterized query against the configured backend (BigQuery or the local SQLite stand-in),
+    # results are shared with the other processes of the node through the disk cache (ttl=None skips it)
+    key = cache_key(BACKEND, query, params)
+
+    # The TTLs must not stack: a refreshed value is at most a few minutes older than the warehouse
+    if ttl and in_refresh():
+        ttl = min(ttl, REFRESH_DISK_CACHE_TTL_SECONDS)
+
+    return get_or_load(key, lambda: get_backend().query(query, params), ttl=ttl)
+
 
 ### WORLD CUP ###
 
-@st.cache_data(ttl='4h', show_spinner='Fetching new data...')
+# Incremental sync only fetches new or changed races, so the results can refresh every few minutes
+# (seconds until a background refresh is started, the old results are served until it is done)
+WC_INCREMENTAL_SYNC = os.environ.get("CROSSCOUNTY_WC_SYNC", "0") == "1"
+RESULTS_TTL_WC = 5 * 60 if WC_INCREMENTAL_SYNC else 4 * 60 * 60
+
+
+def fetch_results_delta_WC(watermark):
+
+    # Rows of races newer than the watermark plus the races of the last few days (late corrections)
+    if watermark["max_racedate"] is not None:
+        since = (pd.Timestamp(watermark["max_racedate"]) - pd.Timedelta(days=SYNC_LOOKBACK_DAYS)).date()
+    else:
+        since = datetime.date(1900, 1, 1)
+
+    query = f"""
+    SELECT {select_list(RESULTS_COLUMNS_WC)} FROM {{fis_results}} 
+    WHERE Sectorcode = 'CC' 
+    AND Seasoncode >= 2023
+    AND Status != 'DNS'
+    AND (Raceid > @max_raceid OR Racedate >= @since)
+    """
+
+    # Always fresh, the delta depends on data that changes between syncs
+    return load_datapool(query, {"max_raceid": int(watermark["max_raceid"]), "since": since}, ttl=None)
+
+
+@traced
+@stale_while_revalidate(RESULTS_TTL_WC, spinner='Fetching new data...')
 def get_results_WC():
 
-    query = """ 
-    SELECT * FROM `swissski-production.raw_fis.fis_results` 
+    # Only the columns the page reads are scanned and transferred
+    query = f""" 
+    SELECT {select_list(RESULTS_COLUMNS_WC)} FROM {{fis_results}} 
     WHERE Sectorcode = 'CC' 
     AND Seasoncode >= 2023
     AND Status != 'DNS'
@@ -41,19 +84,49 @@ def get_results_WC():
 
     #df = load_datapool(query)
 
-    
-    try:
-        df = pd.read_csv("results_cc.csv")
-    except FileNotFoundError:
-        df = load_datapool(query)
-        df.to_csv("results_cc.csv", index=False)
+    # Read the compact typed snapshot, build it from the CSV or the warehouse if missing
+    # (building it keeps only RESULTS_COLUMNS_WC and downcasts them, see compact_results).
+    # Fetch and write errors of a sync propagate, the stale results are served until a retry works
+    if not os.path.exists(RESULTS_SNAPSHOT_WC):
+        df = build_results_snapshot_WC(query)
+    elif WC_INCREMENTAL_SYNC:
+        # Merge only the rows newer than the stored watermark into the snapshot
+        df = sync_results_snapshot(fetch_results_delta_WC, RESULTS_SNAPSHOT_WC)
+    else:
+        df = read_results_snapshot(RESULTS_SNAPSHOT_WC, columns=RESULTS_COLUMNS_WC)
+
+    # The results are as old as the last build or sync of the snapshot, not this read
+    loaded_at = watermark_loaded_at()
+    if loaded_at is not None:
+        report_data_time(loaded_at)
+
+    # Shared between sessions (not copied), callers must not modify it in place
+    return prepare_results_WC(df)
+
+
+def build_results_snapshot_WC(query):
 
-    df_athletes_sorted = df.copy()
+    # The first process of a node builds the snapshot, the others wait for it and then read it
+    with snapshot_lock(RESULTS_SNAPSHOT_WC):
+        if os.path.exists(RESULTS_SNAPSHOT_WC):
+            return read_results_snapshot(RESULTS_SNAPSHOT_WC, columns=RESULTS_COLUMNS_WC)
 
-    # Sort by lowest position and highest season
-    df_athletes_sorted['Position'] = pd.to_numeric(df_athletes_sorted['Position'], errors='coerce')
-    df_athletes_sorted['Seasoncode'] = pd.to_numeric(df_athletes_sorted['Seasoncode'], errors='coerce')
-    df_athletes_sorted = df_athletes_sorted.sort_values(by=['Position', 'Seasoncode'], ascending=[True, False])
+        if os.path.exists(RESULTS_CSV_WC):
+            # The CSV's data is as old as the file
+            df = convert_csv_to_snapshot(RESULTS_CSV_WC, RESULTS_SNAPSHOT_WC)
+            write_watermark(compute_watermark(df, loaded_at=os.path.getmtime(RESULTS_CSV_WC)))
+        else:
+            df = write_results_snapshot(load_datapool(query), RESULTS_SNAPSHOT_WC)
+            write_watermark(compute_watermark(df))
+
+    return df
+
+
+@traced
+def prepare_results_WC(df):
+
+    # Sort by lowest position and highest season (Position and Seasoncode are numeric already)
+    df_athletes_sorted = df.sort_values(by=['Position', 'Seasoncode'], ascending=[True, False])
 
 
     athletes_unique = df_athletes_sorted['Competitorname'].unique().tolist()
@@ -62,87 +135,186 @@ def get_results_WC():
 
     seasons_unique = sorted(seasons_unique, reverse=True)
 
-    return df, athletes_unique, seasons_unique, descriptions_unique
+    # Group the rows by athlete, season and discipline so selections are slices instead of scans
+    df, results_index = build_results_index(df)
 
+    # Changes only when the results change, keys the memoized tables, figures and derived caches
+    data_version = frame_version(df)
 
+    return df, athletes_unique, seasons_unique, descriptions_unique, results_index, data_version
 
-### LOWER CUP ###
 
-@st.cache_data(ttl='4h', show_spinner='Fetching new data...')
-def get_selected_data_LC(season, athlete, compare_on=False):
+@traced
+def select_athlete_results_WC(df, results_index, athletes, season, descriptions):
 
-    if not compare_on:
-        query = f"""
-        SELECT * FROM `swissski-production.raw_fis.fis_results` 
-        WHERE Sectorcode = 'AL' 
-        AND Catcode != 'WC'
-        AND Seasoncode = {season}
-        AND Competitorname = '{athlete}'
-        AND Status != 'DNS'
-        """
-
-        df = load_datapool(query)
-        
-        if not df.empty:
-            df = df[df['Description'].isin(['Downhill', 'Slalom', 'Super G', 'Giant Slalom', 'Alpine Combined'])]
-            df["Racepoints"] = pd.to_numeric(df["Racepoints"], errors="coerce")
-            
-            nation = df['Competitor_Nationcode'].unique().tolist()
-            nation = nation[0]
-
-            categories_unique = df['Catcode'].unique().tolist()
-            disciplines_unique = df['Description'].unique().tolist()
-
-            return df, nation, categories_unique, disciplines_unique
-        
-    else:
-        query = f"""
-        SELECT * FROM `swissski-production.raw_fis.fis_results` 
-        WHERE Sectorcode = 'AL' 
-        AND Catcode != 'WC'
-        AND Seasoncode = {season}
-        AND Status != 'DNS'
-        AND Competitorname IN ({', '.join(f"'{name}'" for name in athlete)})
-        """
+    # Results of the athletes in the season and disciplines, with WC points, in race order
+    df = select_results(df, results_index, athletes, season=season)
+    df['WC_Points'] = score_positions(df['Position'])
+    df = df[df["Description"].isin(descriptions)]
 
-        df = load_datapool(query)
+    return df.sort_values(by='Racedate')
 
-        if not df.empty:
-            df = df[df['Description'].isin(['Downhill', 'Slalom', 'Super G', 'Giant Slalom', 'Alpine Combined'])]
-            df["Racepoints"] = pd.to_numeric(df["Racepoints"], errors="coerce")
 
-            categories_unique = df['Catcode'].unique().tolist()
-            disciplines_unique = df['Description'].unique().tolist()
+def table_key_WC(data_version, athletes, season, descriptions, compare_on):
 
-        return df, "SUI", categories_unique, disciplines_unique
+    # Key of the memoized results table of a WC selection
+    return ("WC", data_version, tuple(athletes), season, tuple(descriptions), compare_on)
 
-    return df, None, None, None
 
+@traced
+def get_aggregates_WC():
 
-@st.cache_data(ttl='4h', show_spinner='Fetching new data...')
-def get_selection_options_LC(season):
-    
+    # Podium counts, Top3/10/30 buckets and WC points for every (athlete, season, discipline)
+    results = get_results_WC()
+
+    return _aggregates_WC(results[5], results[0])
+
+
+@st.cache_data(max_entries=2, show_spinner='Computing overview metrics...')
+def _aggregates_WC(data_version, _df):
+
+    # Cached per loaded version of the results (the frame itself is not hashed)
+    return build_aggregates_WC(_df)
+
+
+@traced
+def get_position_matrix_WC(season):
+
+    # (race x athlete) positions of a season, shared by every compare selection of that season
+    results = get_results_WC()
+
+    return _position_matrix_WC(season, results[5], results[0])
+
+
+@st.cache_data(max_entries=16, show_spinner='Computing head-to-head...')
+def _position_matrix_WC(season, data_version, _df):
+
+    return build_position_matrix(_df[_df["Seasoncode"] == season])
+
+
+# Standings of the last loaded results, updated race by race when the results change
+_standings_WC = {"version": None, "standings": None}
+_standings_lock_WC = threading.Lock()
+
+
+@traced
+def get_standings_WC():
+
+    # One call, a refresh swapped in between two calls would pair old results with the new version
+    results = get_results_WC()
+    df, data_version = results[0], results[5]
+
+    with _standings_lock_WC:
+        if _standings_WC["standings"] is None:
+            _standings_WC["standings"] = build_standings_WC(df)
+
+        elif _standings_WC["version"] != data_version:
+            # New races plus the races of the last few days (late corrections) are scored again
+            recent = pd.to_datetime(df["Racedate"]) >= pd.to_datetime(df["Racedate"]).max() - pd.Timedelta(days=SYNC_LOOKBACK_DAYS)
+            changed = ~df["Raceid"].isin(_standings_WC["standings"]["races"]) | recent
+            _standings_WC["standings"] = update_standings_WC(_standings_WC["standings"], df[changed])
+
+        _standings_WC["version"] = data_version
+
+        return _standings_WC["standings"]
+
+
+
+### LOWER CUP ###
+
+LC_DISCIPLINES = ['Downhill', 'Slalom', 'Super G', 'Giant Slalom', 'Alpine Combined']
+
+# Seconds until a season is refreshed in the background, the old data is served until it is done
+DATA_TTL_LC = 4 * 60 * 60
+
+# Season partitions kept per process: the selected and the prefetched previous season of a few sessions
+SEASON_PARTITIONS_LC = 4
+
+
+@traced
+@stale_while_revalidate(DATA_TTL_LC, spinner='Fetching new data...', max_entries=SEASON_PARTITIONS_LC)
+def get_season_data_LC(season):
+
+    # All Lower Cup results of a season are loaded once, selections are sliced locally
     query = f"""
-    SELECT Competitorname, Competitor_Nationcode, Gender
-    FROM `swissski-production.raw_fis.fis_results`
-    WHERE Sectorcode = 'AL'
+    SELECT {select_list(SEASON_COLUMNS_LC)} FROM {{fis_results}} 
+    WHERE Sectorcode = 'AL' 
     AND Catcode != 'WC'
-    AND Seasoncode = {season}
-    AND Description IN ('Downhill', 'Slalom', 'Super G', 'Giant Slalom', 'Alpine Combined')
+    AND Seasoncode = @season
     AND Status != 'DNS'
-    GROUP BY Competitorname, Competitor_Nationcode, Gender;
     """
 
-    df = load_datapool(query)
+    df = load_datapool(query, {"season": int(season)})
+    df = df[df['Description'].isin(LC_DISCIPLINES)]
 
-    return df
+    # Shared between sessions (not copied), callers must not modify it in place
+    df, season_index = build_results_index(compact_season_LC(df))
+
+    return df, season_index, frame_version(df)
+
+
+@traced
+def get_selected_data_LC(season, athlete, compare_on=False):
+
+    df_season, season_index, _ = get_season_data_LC(season)
+
+    athletes = [athlete] if not compare_on else list(athlete)
+    df = select_results(df_season, season_index, athletes)
+
+    if df.empty:
+        return df, None, None, None
+
+    categories_unique = df['Catcode'].unique().tolist()
+    disciplines_unique = df['Description'].unique().tolist()
+
+    if not compare_on:
+        nation = df['Competitor_Nationcode'].unique().tolist()
+        nation = nation[0]
+
+        return df, nation, categories_unique, disciplines_unique
+
+    return df, "SUI", categories_unique, disciplines_unique
+
+
+@traced
+@st.cache_data(max_entries=32, show_spinner='Computing points list...')
+def get_points_list_LC(season, swiss_only=False, data_version=None):
+
+    # Points list as of the last race of the season, built from the season partition only so it
+    # covers the same races as the season's cards and totals (a season is shorter than the window)
+    # (data_version only keys the cache to the loaded season partition)
+    df = get_season_data_LC(season)[0]
+
+    # Swiss only counts races held in Switzerland
+    if swiss_only:
+        df = df[df["Nationcode"] == "SUI"]
+
+    as_of = pd.Series({season: df["Racedate"].max()}).rename_axis("Seasoncode")
+
+    return build_points_list(df, as_of).droplevel("Seasoncode")
+
+
+@traced
+def get_selection_options_LC(season):
+
+    # Derived from the season partition instead of a separate query
+    df_season, _, data_version = get_season_data_LC(season)
+
+    return _selection_options_LC(season, data_version, df_season)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _selection_options_LC(season, data_version, _df_season):
+
+    return _df_season[['Competitorname', 'Competitor_Nationcode', 'Gender']].drop_duplicates().reset_index(drop=True)
 
 
-@st.cache_data(ttl='4h', show_spinner='Fetching new data...')
+@traced
+@stale_while_revalidate(DATA_TTL_LC, spinner='Fetching new data...')
 def get_seasons_LC():
 
     query_seasons = """
-    SELECT DISTINCT Seasoncode FROM `swissski-production.raw_fis.fis_results` 
+    SELECT DISTINCT Seasoncode FROM {fis_results} 
     WHERE Sectorcode = 'AL' 
     AND Seasoncode >= 2014
     """
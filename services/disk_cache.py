@@ -0,0 +1,165 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import pyarrow as pa
+
+from services.swr import report_data_time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, writes stay atomic
+    fcntl = None
+
+
+# Loader results shared by all Streamlit processes of a node, one Arrow IPC file per content key
+DISK_CACHE_ENABLED = os.environ.get("CROSSCOUNTY_DISK_CACHE", "1") == "1"
+DISK_CACHE_DIR = os.environ.get("CROSSCOUNTY_DISK_CACHE_DIR", ".cache/loaders")
+DISK_CACHE_MAX_MB = int(os.environ.get("CROSSCOUNTY_DISK_CACHE_MAX_MB", "2048"))
+
+# Same lifetime as the in-memory caches of the loaders
+DISK_CACHE_TTL_SECONDS = 4 * 60 * 60
+
+# A background refresh only takes over files this recent (written by another process's refresh),
+# otherwise it would swap in data almost as old as the value it replaces
+REFRESH_DISK_CACHE_TTL_SECONDS = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+def cache_key(*parts):
+
+    # Content address of a load: everything that determines its result (backend, query, parameters)
+    payload = json.dumps(parts, sort_keys=True, default=str)
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _path(key, suffix=".arrow", cache_dir=None):
+
+    return os.path.join(cache_dir or DISK_CACHE_DIR, key + suffix)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+
+    # Exclusive lock between processes (flock) and between the threads of this process
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(path, threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_frame(key, ttl=DISK_CACHE_TTL_SECONDS, cache_dir=None):
+
+    # Cached DataFrame of the key, None if missing or older than ttl seconds
+    path = _path(key, cache_dir=cache_dir)
+
+    try:
+        written_at = os.stat(path).st_mtime
+        if time.time() - written_at > ttl:
+            return None
+
+        with pa.memory_map(path) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+
+    # The access time drives the LRU eviction, the modification time stays the write time (TTL)
+    with contextlib.suppress(OSError):
+        os.utime(path, (time.time(), written_at))
+
+    # A value loaded from this file is as old as the file
+    report_data_time(written_at)
+
+    return df
+
+
+def write_frame(key, df, cache_dir=None):
+
+    # Written to a temporary file and renamed, readers never see a partial file
+    cache_dir = cache_dir or DISK_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    path = _path(key, cache_dir=cache_dir)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        os.replace(tmp_path, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+
+    evict(cache_dir=cache_dir)
+
+
+def evict(max_mb=DISK_CACHE_MAX_MB, cache_dir=None):
+
+    # Least recently read payloads go first until the cache fits into max_mb
+    cache_dir = cache_dir or DISK_CACHE_DIR
+
+    with file_lock(os.path.join(cache_dir, ".evict.lock")):
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".arrow"):
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_mb * 1024**2:
+                break
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+
+def get_or_load(key, load, ttl=DISK_CACHE_TTL_SECONDS, cache_dir=None):
+
+    # One process loads a missing key while the others wait for it and then read its result
+    if not DISK_CACHE_ENABLED or not ttl:
+        return load()
+
+    df = read_frame(key, ttl, cache_dir)
+    if df is not None:
+        return df
+
+    cache_dir = cache_dir or DISK_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    with file_lock(_path(key, ".lock", cache_dir)):
+        df = read_frame(key, ttl, cache_dir)
+        if df is not None:
+            return df
+
+        df = load()
+
+        try:
+            write_frame(key, df, cache_dir)
+        except (OSError, pa.ArrowException):
+            logger.warning("Could not write %s to the disk cache", key, exc_info=True)
+
+    return df
@@ -0,0 +1,94 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+
+# Everything app_cc.py imports before the first element renders
+STARTUP_MODULES = [
+    'streamlit',
+    'streamlit_option_menu',
+    'services.database_utils',
+    'services.data_functions',
+    'services.results_index',
+    'services.charts',
+]
+
+# Only imported once a chart renders, must never show up on the startup path
+# (streamlit itself already pulls in plotly.graph_objects for st.plotly_chart)
+DEFERRED_MODULES = ['plotly.express', 'matplotlib']
+
+# Total startup import budget in milliseconds
+STARTUP_BUDGET_MS = 3000
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import_times(modules=STARTUP_MODULES):
+
+    # Import in a fresh interpreter so nothing is already cached in sys.modules
+    code = "; ".join(f"import {module}" for module in modules)
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=repo_root
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # (module, self_ms, cumulative_ms, depth)
+    timings = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append((module, int(self_us) / 1000, int(cumulative_us) / 1000, len(indent) // 2))
+
+    return timings
+
+
+def report_import_times(timings, top=15):
+
+    # Top level imports add up to the total startup cost
+    top_level = [timing for timing in timings if timing[3] == 0]
+    total_ms = sum(timing[2] for timing in top_level)
+
+    print(f"{'module':<50} {'self [ms]':>10} {'cumulative [ms]':>16}")
+    for module, self_ms, cumulative_ms, _ in sorted(timings, key=lambda timing: timing[2], reverse=True)[:top]:
+        print(f"{module:<50} {self_ms:>10.1f} {cumulative_ms:>16.1f}")
+
+    print(f"\nTotal startup imports: {total_ms:.1f} ms")
+
+    return total_ms
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Per-module import cost of the dashboard startup path")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = measure_import_times()
+    total_ms = report_import_times(timings, top=args.top)
+
+    imported = {module for module, _, _, _ in timings}
+    eager = [module for module in DEFERRED_MODULES if module in imported]
+
+    failed = False
+    if eager:
+        print(f"Deferred modules imported at startup: {', '.join(eager)}")
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print(f"Startup import budget exceeded: {total_ms:.1f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
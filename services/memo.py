@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+
+    # Bounded, process-wide memo shared by all sessions, with hit/miss counters
+    def __init__(self, maxsize=64):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+
+            self.misses += 1
+
+        # Built outside the lock, two sessions missing the same key at once both build it
+        value = build()
+
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+        return value
+
+    def clear(self):
+
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+
+        with self._lock:
+            return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
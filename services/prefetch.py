@@ -0,0 +1,63 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from services.backends import MAX_CONCURRENT_QUERIES
+
+
+logger = logging.getLogger(__name__)
+
+# Loads run on a shared pool, one worker per query slot of the backend
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES, thread_name_prefix="prefetch")
+_in_flight = {}
+_lock = threading.Lock()
+
+
+def prefetch(loader, *args):
+
+    # Start a cached loader in the background, the same call already running is reused
+    key = (loader.__qualname__, args)
+
+    with _lock:
+        future = _in_flight.get(key)
+        if future is not None and not future.done():
+            return future
+
+        future = _executor.submit(_run, get_script_run_ctx(), loader, args)
+        _in_flight[key] = future
+
+    # Finished loads are dropped, the result lives in the loader's cache (which may evict it)
+    future.add_done_callback(lambda done: _forget(key, done))
+
+    return future
+
+
+def _forget(key, future):
+
+    with _lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def _run(ctx, loader, args):
+
+    # Attach the session so the loader's spinner and cache behave like on the script thread
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+    try:
+        return loader(*args)
+    except Exception:
+        logger.exception("Prefetch of %s%s failed", loader.__qualname__, args)
+        raise
+
+
+def current_season(today=None):
+
+    # FIS seasons are named after the year they end in (2024/25 -> 2025), new season from July
+    today = today or datetime.date.today()
+
+    return today.year + 1 if today.month >= 7 else today.year
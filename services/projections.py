@@ -0,0 +1,188 @@
+import ast
+import os
+import sys
+
+
+# All columns of raw_fis.fis_results
+FIS_RESULTS_COLUMNS = [
+    'Raceid', 'Racedate', 'Seasoncode', 'Description', 'Gender', 'Calstatuscode', 'Sectorcode',
+    'Competitorid', 'Competitorname', 'Competitor_Nationcode', 'Fiscode', 'Level', 'Teamid',
+    'Disciplinename', 'Catname', 'IsTeamResult', 'Catcode', 'Position', 'Status', 'Racepoints',
+    'Details', 'Disciplinecode', 'Nationcode', 'Place', 'Webcomment', 'Bib',
+]
+
+# Columns the Cross Country page and the services it calls read (Competitorid keys the delta sync)
+RESULTS_COLUMNS_WC = [
+    'Raceid',
+    'Racedate',
+    'Seasoncode',
+    'Description',
+    'Competitorid',
+    'Competitorname',
+    'Competitor_Nationcode',
+    'Place',
+    'Nationcode',
+    'Disciplinecode',
+    'Webcomment',
+    'Bib',
+    'Position',
+    'Status',
+    'Details',
+    'Racepoints',
+]
+
+# Columns the Lower Cup page and the services it calls read
+SEASON_COLUMNS_LC = [
+    'Raceid',
+    'Racedate',
+    'Seasoncode',
+    'Description',
+    'Gender',
+    'Competitorname',
+    'Competitor_Nationcode',
+    'Catcode',
+    'Place',
+    'Nationcode',
+    'Disciplinecode',
+    'Webcomment',
+    'Bib',
+    'Position',
+    'Status',
+    'Details',
+    'Racepoints',
+]
+
+# Page title in app_cc.py -> columns projected for it
+PAGE_COLUMNS = {
+    "Cross Country": RESULTS_COLUMNS_WC,
+    "Lower Cup": SEASON_COLUMNS_LC,
+}
+
+# Services named with the other page's suffix are not followed when checking a page
+PAGE_SUFFIXES = {
+    "Cross Country": "_WC",
+    "Lower Cup": "_LC",
+}
+
+
+def select_list(columns):
+
+    return ", ".join(columns)
+
+
+### PROJECTION CHECK ###
+
+def _used_columns(nodes):
+
+    # Every fis_results column name used as a string in the code, except inside drop(...) calls
+    dropped = set()
+    used = set()
+
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Call) and getattr(child.func, "attr", None) == "drop":
+                for inner in ast.walk(child):
+                    if isinstance(inner, ast.Constant):
+                        dropped.add(id(inner))
+
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and child.value in FIS_RESULTS_COLUMNS and id(child) not in dropped:
+                used.add(child.value)
+
+    return used
+
+
+def _page_bodies(tree):
+
+    # if selected == "Cross Country": ... elif selected == "Lower Cup": ...
+    pages = {}
+
+    for node in tree.body:
+        while isinstance(node, ast.If):
+            test = node.test
+            if isinstance(test, ast.Compare) and isinstance(test.comparators[0], ast.Constant):
+                pages[test.comparators[0].value] = node.body
+            node = node.orelse[0] if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If) else None
+
+    return pages
+
+
+def _service_definitions(services_dir):
+
+    # Top-level functions and constants of the services modules by name
+    # (this module only declares the projections, it is not scanned)
+    definitions = {}
+
+    for file_name in sorted(os.listdir(services_dir)):
+        if not file_name.endswith(".py") or file_name == os.path.basename(__file__):
+            continue
+
+        with open(os.path.join(services_dir, file_name)) as f:
+            tree = ast.parse(f.read())
+
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef):
+                definitions.setdefault(node.name, []).append(node)
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        definitions.setdefault(target.id, []).append(node)
+
+    return definitions
+
+
+def _reachable(nodes, definitions, skip_suffixes=()):
+
+    # The nodes plus every services function and constant they reference, transitively
+    # (loaders, engines, index and key constants the page never names itself)
+    reached = list(nodes)
+    queue = list(nodes)
+    seen = set()
+
+    while queue:
+        for child in ast.walk(queue.pop()):
+            if isinstance(child, ast.Name) and child.id in definitions and child.id not in seen:
+                if child.id.endswith(tuple(skip_suffixes)):
+                    continue
+                seen.add(child.id)
+                reached.extend(definitions[child.id])
+                queue.extend(definitions[child.id])
+
+    return reached
+
+
+def check_projections(repo_root=None):
+
+    repo_root = repo_root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with open(os.path.join(repo_root, "app_cc.py")) as f:
+        app_tree = ast.parse(f.read())
+
+    definitions = _service_definitions(os.path.join(repo_root, "services"))
+
+    missing = {}
+    for page, body in _page_bodies(app_tree).items():
+        if page not in PAGE_COLUMNS:
+            continue
+
+        other_suffixes = [suffix for other, suffix in PAGE_SUFFIXES.items() if other != page]
+        reached = _reachable(body, definitions, other_suffixes)
+
+        not_projected = sorted(_used_columns(reached) - set(PAGE_COLUMNS[page]))
+        if not_projected:
+            missing[page] = not_projected
+
+    return missing
+
+
+if __name__ == "__main__":
+    # python -m services.projections
+    missing = check_projections()
+
+    for page, columns in missing.items():
+        print(f"{page} uses columns that are not projected: {', '.join(columns)}")
+
+    if not missing:
+        print("All used columns are projected")
+
+    sys.exit(1 if missing else 0)
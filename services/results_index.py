@@ -0,0 +1,67 @@
+import numpy as np
+
+from services.tracing import traced
+
+
+# Rows are grouped by athlete -> season -> discipline so every selection is a set of contiguous slices
+INDEX_COLUMNS = ['Competitorname', 'Seasoncode', 'Description']
+
+
+@traced
+def build_results_index(df):
+
+    # Sort once so the rows of every (athlete, season, discipline) group are contiguous
+    df = df.sort_values(by=INDEX_COLUMNS + ['Racedate'], kind='stable').reset_index(drop=True)
+
+    if df.empty:
+        return df, {}
+
+    # Find the group boundaries in one pass over the key columns
+    changed = np.zeros(len(df), dtype=bool)
+    changed[0] = True
+    for column in INDEX_COLUMNS:
+        # Compare category codes instead of strings where possible
+        if df[column].dtype == 'category':
+            values = df[column].cat.codes.to_numpy()
+        else:
+            values = df[column].to_numpy()
+        changed[1:] |= values[1:] != values[:-1]
+
+    starts = np.flatnonzero(changed)
+    stops = np.append(starts[1:], len(df))
+
+    athletes = df['Competitorname'].to_numpy()[starts]
+    seasons = df['Seasoncode'].to_numpy()[starts]
+    descriptions = df['Description'].to_numpy()[starts]
+
+    # athlete -> season -> discipline -> (start, stop)
+    index = {}
+    for athlete, season, description, start, stop in zip(athletes, seasons, descriptions, starts, stops):
+        index.setdefault(athlete, {}).setdefault(int(season), {})[description] = (int(start), int(stop))
+
+    return df, index
+
+
+@traced
+def select_results(df, index, athletes, season=None, descriptions=None):
+
+    if isinstance(athletes, str):
+        athletes = [athletes]
+
+    slices = []
+    for athlete in athletes:
+        seasons = index.get(athlete, {})
+        season_keys = seasons.keys() if season is None else [season]
+
+        for season_key in season_keys:
+            disciplines = seasons.get(season_key, {})
+            description_keys = disciplines.keys() if descriptions is None else descriptions
+
+            for description in description_keys:
+                if description in disciplines:
+                    start, stop = disciplines[description]
+                    slices.append(np.arange(start, stop))
+
+    positions = np.concatenate(slices) if slices else np.array([], dtype=np.int64)
+
+    return df.take(positions)
@@ -0,0 +1,267 @@
+import os
+import json
+import logging
+import threading
+import pandas as pd
+import pyarrow.parquet as pq
+
+from services.projections import RESULTS_COLUMNS_WC
+from services.disk_cache import file_lock
+
+
+# Columnar snapshot of the World Cup results (replaces re-parsing results_cc.csv)
+RESULTS_CSV_WC = "results_cc.csv"
+# (the version changes with the snapshot schema so old snapshots are rebuilt)
+RESULTS_SNAPSHOT_WC = "results_cc.v2.parquet"
+RESULTS_WATERMARK_WC = "results_cc.watermark.json"
+
+# Races this close to the newest race date are refetched to pick up corrected results
+SYNC_LOOKBACK_DAYS = 3
+
+# Key of a single result row
+RESULT_KEY = ['Raceid', 'Competitorid']
+
+# Fixed schema of the snapshot, integers are downcast to the smallest type that fits
+CATEGORY_COLUMNS = ['Competitorname', 'Competitor_Nationcode', 'Description', 'Disciplinecode', 'Nationcode', 'Place', 'Status', 'Webcomment']
+DATE_COLUMNS = ['Racedate']
+INTEGER_COLUMNS = {'Raceid': 'int32', 'Competitorid': 'int32', 'Seasoncode': 'int16', 'Position': 'int16'}
+NULLABLE_INTEGER_COLUMNS = {'Bib': 'Int16'}
+FLOAT_COLUMNS = {'Racepoints': 'float32'}
+
+logger = logging.getLogger(__name__)
+
+# Memory report of the last compaction in this process, shown in the debug panel
+last_compaction = {"before_mb": None, "after_mb": None, "rows": None}
+
+
+def apply_results_schema(df):
+
+    df = df.copy()
+
+    for column, dtype in INTEGER_COLUMNS.items():
+        if column in df.columns:
+            # Position 0 already means "not ranked" (DNF, DSQ, ...) in this app
+            df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(dtype)
+
+    for column, dtype in NULLABLE_INTEGER_COLUMNS.items():
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+
+    for column, dtype in FLOAT_COLUMNS.items():
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+def compact_results(df, columns=RESULTS_COLUMNS_WC):
+
+    # Ingestion stage: keep only the used columns, then categoricals and downcast numbers
+    before_mb = df.memory_usage(deep=True).sum() / 1024**2
+
+    df = apply_results_schema(df[[column for column in columns if column in df.columns]])
+
+    after_mb = df.memory_usage(deep=True).sum() / 1024**2
+    logger.info("Results frame compacted from %.1f MB to %.1f MB (%d rows)", before_mb, after_mb, len(df))
+    last_compaction.update(before_mb=before_mb, after_mb=after_mb, rows=len(df))
+
+    return df
+
+
+def compaction_summary():
+
+    if last_compaction["rows"] is None:
+        return "Results snapshot read as stored (not compacted in this process)"
+
+    return (f"Results frame compacted from {last_compaction['before_mb']:.1f} MB to "
+            f"{last_compaction['after_mb']:.1f} MB ({last_compaction['rows']} rows)")
+
+
+def _tmp_path(path):
+
+    # Unique per process and thread, concurrent writers never rename each other's file
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def snapshot_lock(snapshot_path=RESULTS_SNAPSHOT_WC):
+
+    # Serializes snapshot builds and syncs between the processes and threads of a node
+    return file_lock(f"{snapshot_path}.lock")
+
+
+def write_results_snapshot(df, snapshot_path=RESULTS_SNAPSHOT_WC):
+
+    df = compact_results(df)
+
+    # Write to a temporary file first so readers never see a half written snapshot
+    tmp_path = _tmp_path(snapshot_path)
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, snapshot_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df
+
+
+def convert_csv_to_snapshot(csv_path=RESULTS_CSV_WC, snapshot_path=RESULTS_SNAPSHOT_WC):
+
+    df = pd.read_csv(csv_path)
+
+    return write_results_snapshot(df, snapshot_path)
+
+
+def read_results_snapshot(snapshot_path=RESULTS_SNAPSHOT_WC, columns=None):
+
+    if not os.path.exists(snapshot_path):
+        raise FileNotFoundError(snapshot_path)
+
+    # Only load the requested columns, categoricals and dates come back typed
+    if columns is not None:
+        available = pq.read_schema(snapshot_path).names
+        columns = [column for column in columns if column in available]
+
+    return pd.read_parquet(snapshot_path, columns=columns)
+
+
+### LOWER CUP SEASON PARTITIONS ###
+
+# Repeated strings of a Lower Cup season are stored as categoricals
+CATEGORY_COLUMNS_LC = [
+    'Competitorname',
+    'Competitor_Nationcode',
+    'Gender',
+    'Description',
+    'Disciplinecode',
+    'Catcode',
+    'Nationcode',
+    'Place',
+    'Status',
+]
+
+
+def compact_season_LC(df):
+
+    df = df.copy()
+
+    df['Racepoints'] = pd.to_numeric(df['Racepoints'], errors='coerce')
+
+    # Parsed once here instead of on every use
+    df['Racedate'] = pd.to_datetime(df['Racedate'], errors='coerce')
+
+    for column in CATEGORY_COLUMNS_LC:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    return df
+
+
+### INCREMENTAL SYNC ###
+
+def compute_watermark(df, loaded_at=None):
+
+    # loaded_at (epoch seconds, default now) is when the data left its source, e.g. the CSV's mtime
+    loaded_at = pd.Timestamp.fromtimestamp(loaded_at).isoformat() if loaded_at is not None else pd.Timestamp.now().isoformat()
+
+    if df.empty:
+        return {"max_raceid": 0, "max_racedate": None, "loaded_at": loaded_at}
+
+    return {
+        "max_raceid": int(df['Raceid'].max()),
+        "max_racedate": pd.Timestamp(df['Racedate'].max()).date().isoformat(),
+        "loaded_at": loaded_at,
+    }
+
+
+def watermark_loaded_at(watermark_path=RESULTS_WATERMARK_WC):
+
+    # Epoch seconds of the last build or sync of the snapshot, None without a watermark
+    watermark = read_watermark(watermark_path)
+    if watermark is None:
+        return None
+
+    return pd.Timestamp(watermark["loaded_at"]).to_pydatetime().timestamp()
+
+
+def frame_version(df):
+
+    # Content hash of a frame, stays the same across reloads of unchanged data
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def read_watermark(watermark_path=RESULTS_WATERMARK_WC):
+
+    try:
+        with open(watermark_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_watermark(watermark, watermark_path=RESULTS_WATERMARK_WC):
+
+    tmp_path = _tmp_path(watermark_path)
+    with open(tmp_path, "w") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, watermark_path)
+
+
+def merge_results(df, df_delta):
+
+    if df_delta.empty:
+        return df
+
+    df_delta = apply_results_schema(df_delta)
+
+    # Refetched races replace their old rows completely (corrections, removed results)
+    df = df[~df['Raceid'].isin(df_delta['Raceid'].unique())]
+
+    df = pd.concat([df, df_delta], ignore_index=True)
+    df = df.drop_duplicates(subset=RESULT_KEY, keep='last')
+
+    # Concatenating categoricals with different categories falls back to object
+    return apply_results_schema(df)
+
+
+def sync_results_snapshot(fetch_delta, snapshot_path=RESULTS_SNAPSHOT_WC, watermark_path=RESULTS_WATERMARK_WC):
+
+    # fetch_delta(watermark) returns the rows newer than the watermark (or of recently changed races),
+    # one sync at a time per node, a waiting process then merges only what is still missing
+    with snapshot_lock(snapshot_path):
+        return _sync_results_snapshot(fetch_delta, snapshot_path, watermark_path)
+
+
+def _sync_results_snapshot(fetch_delta, snapshot_path, watermark_path):
+
+    df = read_results_snapshot(snapshot_path)
+
+    watermark = read_watermark(watermark_path) or compute_watermark(df)
+
+    df_delta = fetch_delta(watermark)
+
+    if df_delta is None or df_delta.empty:
+        watermark["loaded_at"] = pd.Timestamp.now().isoformat()
+        write_watermark(watermark, watermark_path)
+        return df
+
+    df = write_results_snapshot(merge_results(df, df_delta), snapshot_path)
+    write_watermark(compute_watermark(df), watermark_path)
+
+    return df
+
+
+if __name__ == "__main__":
+    # python -m services.results_store [results_cc.csv] [results_cc.parquet]
+    import sys
+
+    df = convert_csv_to_snapshot(*sys.argv[1:3])
+    print(f"Wrote {len(df)} rows")
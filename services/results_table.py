@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+
+# Rows per page of the results tables, shorter tables are shown in full
+PAGE_SIZE = 20
+
+
+def _matches(col, text):
+
+    # Case-insensitive substring match, categoricals are matched on their categories only
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        hits = col.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+        return col.isin(col.cat.categories[hits]).to_numpy()
+
+    if pd.api.types.is_object_dtype(col) or pd.api.types.is_string_dtype(col):
+        return col.astype(str).str.contains(text, case=False, regex=False).to_numpy()
+
+    return np.zeros(len(col), dtype=bool)
+
+
+def filter_table(df, text, columns):
+
+    if not text:
+        return df
+
+    mask = np.zeros(len(df), dtype=bool)
+    for column in columns:
+        mask |= _matches(df[column], text)
+
+    return df[mask]
+
+
+def _style_page(page, styles):
+
+    # styles: [(function, column, kwargs)], applied column-wise like Styler.apply
+    styled = page.style
+    for function, column, kwargs in styles:
+        styled = styled.apply(function, subset=[column], **kwargs)
+
+    return styled
+
+
+def render_results_table(df, key, column_order, styles, column_config=None, page_size=PAGE_SIZE):
+
+    # Small tables are shown in full, larger ones are filtered, sorted and paged on the server
+    # and only the visible page is styled and sent to the browser
+    if len(df) <= page_size:
+        st.dataframe(_style_page(df[column_order], styles), hide_index=True, use_container_width=True,
+                     column_config=column_config, column_order=column_order)
+        return
+
+    col1, col2, col3 = st.columns([3, 2, 1])
+
+    with col1:
+        search = st.text_input('Filter rows', key=f"{key}_filter", placeholder='Place, discipline, athlete, ...')
+
+    with col2:
+        sort_by = st.selectbox('Sort by', column_order, index=column_order.index('Racedate'), key=f"{key}_sort")
+
+    with col3:
+        descending = st.toggle('Descending', key=f"{key}_descending")
+
+    df = filter_table(df, search, column_order)
+    df = df.sort_values(by=sort_by, ascending=not descending, kind='stable', na_position='last')
+
+    n_pages = max(1, -(-len(df) // page_size))
+
+    # The selection (and with it the number of pages) can shrink between reruns
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = 1
+
+    page_number = st.number_input(f'Page (of {n_pages})', min_value=1, max_value=n_pages, key=page_key)
+
+    start = (page_number - 1) * page_size
+    page = df.iloc[start:start + page_size][column_order]
+
+    st.dataframe(_style_page(page, styles), hide_index=True, use_container_width=True,
+                 column_config=column_config, column_order=column_order)
+    st.caption(f"Rows {min(start + 1, len(df))}-{start + len(page)} of {len(df)}")
@@ -0,0 +1,210 @@
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+# A failed background refresh is retried after this many seconds, the stale value is served meanwhile
+REFRESH_RETRY_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+# (loader, args) -> {"value", "loaded_at", "data_at", "refreshing", "retry_at"}, shared by all sessions,
+# least recently used first (loaded_at drives the TTL, data_at is how old the loaded data is)
+_entries = OrderedDict()
+_lock = threading.Lock()
+_load_locks = {}
+
+# Set in the background refresh threads
+_refresh_state = threading.local()
+
+# Source times reported by the storage layers during the load running on this thread
+_load_state = threading.local()
+
+
+def stale_while_revalidate(ttl_seconds, spinner=None, max_entries=None):
+
+    # Like st.cache_resource with a ttl, except that an expired value is still returned right away
+    # while a single background thread reloads it and swaps the new value in.
+    # A loader keeps at most max_entries argument combinations, the least recently used go first
+    def decorator(loader):
+
+        @functools.wraps(loader)
+        def wrapper(*args):
+            key = (loader.__qualname__, args)
+
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None:
+                    _entries.move_to_end(key)
+
+            if entry is None:
+                value = _load_cold(key, loader, args, spinner)
+                _evict(loader, max_entries)
+                return value
+
+            if time.time() - entry["loaded_at"] > ttl_seconds:
+                _start_refresh(key, loader, args)
+
+            # A load that uses this value is as old as it
+            report_data_time(entry["data_at"])
+
+            return entry["value"]
+
+        return wrapper
+
+    return decorator
+
+
+def _load_cold(key, loader, args, spinner):
+
+    # First load of a key blocks, concurrent sessions wait for the same load instead of starting their own
+    with _lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _lock:
+            entry = _entries.get(key)
+        if entry is not None:
+            report_data_time(entry["data_at"])
+            return entry["value"]
+
+        if spinner and get_script_run_ctx() is not None:
+            with st.spinner(spinner):
+                value, data_at = _call(loader, args)
+        else:
+            value, data_at = _call(loader, args)
+
+        with _lock:
+            _entries[key] = {"value": value, "loaded_at": time.time(), "data_at": data_at, "refreshing": False, "retry_at": 0}
+
+    return value
+
+
+def report_data_time(timestamp):
+
+    # Called by the storage layers with the time their data was written (file mtime, last sync),
+    # a loaded value is as old as its oldest source
+    times = getattr(_load_state, "times", None)
+    if times is not None:
+        times.append(timestamp)
+
+
+def _call(loader, args):
+
+    # (value, data time): the oldest reported source time, the start of the load if nothing was reported
+    outer = getattr(_load_state, "times", None)
+    _load_state.times = []
+    started_at = time.time()
+
+    try:
+        value = loader(*args)
+        data_at = min(_load_state.times, default=started_at)
+    finally:
+        _load_state.times = outer
+
+    report_data_time(data_at)
+
+    return value, data_at
+
+
+def _evict(loader, max_entries):
+
+    if max_entries is None:
+        return
+
+    with _lock:
+        keys = [key for key in _entries if key[0] == loader.__qualname__]
+        for key in keys[:max(0, len(keys) - max_entries)]:
+            del _entries[key]
+            _load_locks.pop(key, None)
+
+
+def _start_refresh(key, loader, args):
+
+    with _lock:
+        # Evicted by another session's load since the caller read it, the next call loads it again
+        entry = _entries.get(key)
+        if entry is None or entry["refreshing"] or time.time() < entry["retry_at"]:
+            return
+        entry["refreshing"] = True
+
+    threading.Thread(target=_refresh, args=(key, loader, args), name=f"refresh {loader.__qualname__}", daemon=True).start()
+
+
+def _refresh(key, loader, args):
+
+    start = time.perf_counter()
+    _refresh_state.active = True
+    try:
+        value, data_at = _call(loader, args)
+    except Exception:
+        logger.exception("Background refresh of %s%s failed, serving the stale value", loader.__qualname__, args)
+        with _lock:
+            if key in _entries:
+                _entries[key].update(refreshing=False, retry_at=time.time() + REFRESH_RETRY_SECONDS)
+        return
+    finally:
+        _refresh_state.active = False
+
+    # Swapped in as a whole, readers see either the old or the new entry (unless it was evicted meanwhile)
+    with _lock:
+        if key in _entries:
+            _entries[key] = {"value": value, "loaded_at": time.time(), "data_at": data_at, "refreshing": False, "retry_at": 0}
+
+    logger.info("Refreshed %s%s in %.2fs", loader.__qualname__, args, time.perf_counter() - start)
+
+
+def in_refresh():
+
+    # True while a background refresh runs on this thread, shared caches must then not serve old copies
+    return getattr(_refresh_state, "active", False)
+
+
+def data_as_of(loader, *args):
+
+    # (time of the data, refresh running) of a cached value, None if it was never loaded
+    with _lock:
+        entry = _entries.get((loader.__qualname__, args))
+
+    if entry is None:
+        return None
+
+    return entry["data_at"], entry["refreshing"]
+
+
+def peek(loader, *args):
+
+    # Cached value (stale or not) without loading it, None if it was never loaded
+    with _lock:
+        entry = _entries.get((loader.__qualname__, args))
+
+    return None if entry is None else entry["value"]
+
+
+def clear(loader=None):
+
+    with _lock:
+        for key in [key for key in _entries if loader is None or key[0] == loader.__qualname__]:
+            del _entries[key]
+            _load_locks.pop(key, None)
+
+
+def data_as_of_caption(loader, *args):
+
+    # "Data as of HH:MM" of a loaded value, with a note while a newer version is being loaded
+    as_of = data_as_of(loader, *args)
+    if as_of is None:
+        return None
+
+    data_at, refreshing = as_of
+
+    # The date is only shown for data from an earlier day
+    time_format = '%H:%M' if time.localtime(data_at)[:3] == time.localtime()[:3] else '%d.%m.%Y %H:%M'
+    caption = f"Data as of {time.strftime(time_format, time.localtime(data_at))}"
+
+    return caption + " (refreshing...)" if refreshing else caption
@@ -0,0 +1,179 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Tracing is off unless CROSSCOUNTY_TRACE=1, then every rerun records its spans
+# (the waterfall panel additionally needs ?debug=1 in the URL)
+TRACE_ENABLED = os.environ.get("CROSSCOUNTY_TRACE", "0") == "1"
+TRACE_FILE = os.environ.get("CROSSCOUNTY_TRACE_FILE", "traces.jsonl")
+
+# Past this size the trace file is rotated to <file>.1 (the previous rotation is dropped)
+TRACE_FILE_MAX_MB = float(os.environ.get("CROSSCOUNTY_TRACE_FILE_MAX_MB", "50"))
+
+_local = threading.local()
+_file_lock = threading.Lock()
+_disabled_span = contextlib.nullcontext()
+
+
+def start_trace(name):
+
+    # Called at the top of a rerun, spans are collected per script thread
+    if not TRACE_ENABLED:
+        return
+
+    _local.trace = {"name": name, "started_at": time.time(), "start": time.perf_counter(), "spans": [], "stage": None}
+    _local.depth = 0
+
+
+def stage(name):
+
+    # Marks the start of the next page stage (and the end of the previous one) without reindenting the page
+    trace = getattr(_local, "trace", None)
+    if not TRACE_ENABLED or trace is None:
+        return
+
+    _end_stage(trace)
+    trace["stage"] = (name, time.perf_counter())
+    _local.depth = 1
+
+
+def _end_stage(trace):
+
+    if trace["stage"] is None:
+        return
+
+    name, start = trace["stage"]
+    trace["spans"].append({
+        "name": name,
+        "depth": 0,
+        "start_ms": (start - trace["start"]) * 1000,
+        "duration_ms": (time.perf_counter() - start) * 1000,
+    })
+    trace["stage"] = None
+    _local.depth = 0
+
+
+def span(name):
+
+    # Shared no-op context manager when disabled, so the hot path only pays one check
+    if not TRACE_ENABLED or getattr(_local, "trace", None) is None:
+        return _disabled_span
+
+    return _span(name)
+
+
+@contextlib.contextmanager
+def _span(name):
+
+    trace = _local.trace
+    depth = _local.depth
+    start = time.perf_counter()
+
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        trace["spans"].append({
+            "name": name,
+            "depth": depth,
+            "start_ms": (start - trace["start"]) * 1000,
+            "duration_ms": (time.perf_counter() - start) * 1000,
+        })
+
+
+def traced(func):
+
+    # Decorator version of span for the services functions
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not TRACE_ENABLED:
+            return func(*args, **kwargs)
+        with span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def finish_trace():
+
+    # Ends the rerun's trace, appends it to the trace file and returns it for the panel
+    trace = getattr(_local, "trace", None)
+    if not TRACE_ENABLED or trace is None:
+        return None
+
+    _end_stage(trace)
+    _local.trace = None
+
+    record = {
+        "name": trace["name"],
+        "started_at": trace["started_at"],
+        "total_ms": (time.perf_counter() - trace["start"]) * 1000,
+        "spans": sorted(trace["spans"], key=lambda item: item["start_ms"]),
+    }
+
+    with _file_lock:
+        _rotate_trace_file()
+        with open(TRACE_FILE, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return record
+
+
+def _rotate_trace_file(path=TRACE_FILE, max_mb=TRACE_FILE_MAX_MB):
+
+    # Keeps at most two files of max_mb each, so tracing can stay on in production
+    try:
+        if os.path.getsize(path) < max_mb * 1024**2:
+            return
+        os.replace(path, path + ".1")
+    except FileNotFoundError:
+        # Not written yet, or another process rotated it first
+        pass
+
+
+def render_trace_panel(record, caches=None, notes=None):
+
+    # Hidden debug panel with the waterfall of the last rerun
+    import streamlit as st
+
+    if record is None or st.query_params.get("debug") != "1":
+        return
+
+    import plotly.graph_objects as go
+
+    with st.expander(f"Performance: {record['name']} rerun took {record['total_ms']:.0f} ms", expanded=False):
+        spans = record["spans"]
+
+        waterfall = go.Figure(go.Bar(
+            y=[("  " * item["depth"]) + item["name"] for item in spans],
+            x=[item["duration_ms"] for item in spans],
+            base=[item["start_ms"] for item in spans],
+            orientation="h",
+            hovertemplate="%{y}: %{x:.1f} ms<extra></extra>",
+        ))
+
+        waterfall.update_layout(
+            height=max(200, 28 * len(spans)),
+            margin=dict(l=20, r=20, t=20, b=20),
+            xaxis_title="ms since rerun start",
+            yaxis=dict(autorange="reversed"),
+        )
+
+        st.plotly_chart(waterfall, use_container_width=True)
+
+        # Hit/miss counters of the in-process memo caches
+        for name, cache in (caches or {}).items():
+            stats = cache.stats()
+            st.caption(f"{name}: {stats['hits']} hits, {stats['misses']} misses, {stats['size']}/{stats['maxsize']} entries")
+
+        for note in notes or []:
+            st.caption(note)
+
+        st.caption(f"Traces are appended to {TRACE_FILE}")
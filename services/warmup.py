@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from services.database_utils import get_results_WC, get_aggregates_WC, get_standings_WC, get_position_matrix_WC
+from services.database_utils import get_seasons_LC, get_season_data_LC, get_selection_options_LC, get_points_list_LC
+from services.database_utils import select_athlete_results_WC, table_key_WC
+from services.data_functions import build_display_table, get_display_table
+from services.backends import backend_configured
+
+
+# Warm-up runs once at process start and then every interval, well inside the 4h TTL of the loaders
+WARMUP_ENABLED = os.environ.get("CROSSCOUNTY_WARMUP", "1") == "1"
+WARMUP_INTERVAL_SECONDS = int(os.environ.get("CROSSCOUNTY_WARMUP_INTERVAL", str(10 * 60)))
+
+# Results tables of the most viewed athletes are built ahead of their first request
+WARMUP_TOP_ATHLETES = 10
+VIEWS_FILE = os.environ.get("CROSSCOUNTY_VIEWS_FILE", ".cache/athlete_views.json")
+
+logger = logging.getLogger(__name__)
+
+_views = {"WC": Counter()}
+_views_lock = threading.Lock()
+
+# Progress of the current / last run, read by the debug panel
+status = {"running": False, "step": None, "done": 0, "total": 0, "last_run_seconds": None, "last_finished_at": None, "errors": 0}
+
+_started = False
+_start_lock = threading.Lock()
+
+
+### ATHLETE VIEWS ###
+
+def record_view(page, athlete):
+
+    with _views_lock:
+        _views.setdefault(page, Counter())[athlete] += 1
+
+
+def most_viewed(page, n=WARMUP_TOP_ATHLETES):
+
+    with _views_lock:
+        return [athlete for athlete, _ in _views.get(page, Counter()).most_common(n)]
+
+
+def load_views(path=VIEWS_FILE):
+
+    # Counts survive restarts, so the first warm-up already knows the popular athletes
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+
+    with _views_lock:
+        for page, counts in stored.items():
+            _views.setdefault(page, Counter()).update(counts)
+
+
+def save_views(path=VIEWS_FILE):
+
+    with _views_lock:
+        stored = {page: dict(counts.most_common(500)) for page, counts in _views.items()}
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stored, f)
+    os.replace(tmp_path, path)
+
+
+### WARM-UP ###
+
+def _warm_tables_WC(athletes):
+
+    # Default selection of the WC page for each athlete: latest season, all disciplines, no compare
+    df, _, seasons_unique, descriptions_unique, results_index, data_version = get_results_WC()
+
+    for athlete in athletes:
+        key = table_key_WC(data_version, [athlete], seasons_unique[0], descriptions_unique, False)
+        get_display_table(key, lambda: build_display_table(
+            select_athlete_results_WC(df, results_index, [athlete], seasons_unique[0], descriptions_unique)))
+
+
+def warmup_steps(pages=("Cross Country", "Lower Cup")):
+
+    # (name, callable) in the order the pages need them, only for the pages the app shows
+    latest_season_LC = lambda: get_seasons_LC()[0]
+    latest_season_WC = lambda: get_results_WC()[2][0]
+
+    steps = []
+
+    if "Cross Country" in pages:
+        steps += [
+            ("WC results", get_results_WC),
+            ("WC aggregates", get_aggregates_WC),
+            ("WC standings", get_standings_WC),
+            ("WC head-to-head matrix", lambda: get_position_matrix_WC(latest_season_WC())),
+            ("WC most viewed athletes", lambda: _warm_tables_WC(most_viewed("WC"))),
+        ]
+
+    # The Lower Cup only reads from the backend, without a configured one every step would fail
+    if "Lower Cup" in pages and backend_configured():
+        steps += [
+            ("LC seasons", get_seasons_LC),
+            ("LC latest season", lambda: get_season_data_LC(latest_season_LC())),
+            ("LC selection options", lambda: get_selection_options_LC(latest_season_LC())),
+            ("LC points list", lambda: get_points_list_LC(latest_season_LC(), False, get_season_data_LC(latest_season_LC())[2])),
+        ]
+
+    return steps
+
+
+def run_warmup(pages=("Cross Country", "Lower Cup")):
+
+    # Calls every loader once, a warm cache makes this a series of cheap hits
+    steps = warmup_steps(pages)
+    start = time.perf_counter()
+    status.update(running=True, done=0, total=len(steps), errors=0)
+
+    for name, step in steps:
+        status["step"] = name
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            # One failing loader (e.g. the warehouse is down) must not stop the others
+            status["errors"] += 1
+            logger.exception("Warm-up step %s failed", name)
+        else:
+            logger.info("Warm-up %d/%d %s took %.2fs", status["done"] + 1, len(steps), name, time.perf_counter() - step_start)
+        status["done"] += 1
+
+    with_errors = f" ({status['errors']} failed)" if status["errors"] else ""
+    logger.info("Warm-up finished in %.2fs%s", time.perf_counter() - start, with_errors)
+    status.update(running=False, step=None, last_run_seconds=time.perf_counter() - start, last_finished_at=time.time())
+
+    save_views()
+
+
+def _schedule(pages, interval):
+
+    while True:
+        run_warmup(pages)
+        time.sleep(interval)
+
+
+def start_warmup(pages, interval=WARMUP_INTERVAL_SECONDS):
+
+    # Called on every rerun with the pages of the menu, only the first call of the process starts the background thread
+    global _started
+
+    if not WARMUP_ENABLED:
+        return
+
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    load_views()
+    threading.Thread(target=_schedule, args=(tuple(pages), interval), name="warmup", daemon=True).start()
+
+
+def warmup_summary():
+
+    if status["running"]:
+        return f"Warm-up running: {status['done']}/{status['total']} ({status['step']})"
+
+    if status["last_finished_at"] is None:
+        return "Warm-up has not run yet"
+
+    finished = time.strftime("%H:%M:%S", time.localtime(status["last_finished_at"]))
+    return f"Last warm-up finished at {finished} in {status['last_run_seconds']:.1f}s ({status['errors']} failed steps)"